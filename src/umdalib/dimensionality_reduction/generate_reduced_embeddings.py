@@ -101,6 +101,34 @@ def save_diagnostics_to_json(
     logger.info(f"Saved diagnostics to {diagnostics_file}")
 
 
+# compute() memoizes the result until the vectors or the saved reduction change
+CACHEABLE = True
+# methods that give a different embedding on every run without a random_state
+STOCHASTIC_METHODS = ["UMAP", "t-SNE", "TriMap", "PHATE"]
+
+
+def get_cache_files(args: Args):
+    method = getattr(args, "method", Args.method)
+    params = getattr(args, "params", None) or {}
+    if method in STOCHASTIC_METHODS and params.get("random_state") is None:
+        return None  # a re-run is meant to be a new embedding, not a replay
+
+    source = pt(args.dr_savefile)
+    dr_savefile = source
+    if dr_savefile.suffix != ".npy":
+        dr_savefile = dr_savefile.with_name(f"{dr_savefile.name}.npy")
+    output_files = [
+        dr_savefile,
+        source.with_suffix(".metadata.json"),
+        source.parent / "dr_pipelines" / f"{source.stem}.joblib",
+    ]
+    if getattr(args, "save_diagnostics", Args.save_diagnostics):
+        output_files.append(
+            source.parent / "dr_diagnostics" / f"{source.stem}.diagnostics.json"
+        )
+    return [args.vector_file], output_files
+
+
 def main(args: Args):
     logger.info("Starting dimensionality reduction pipeline")
     args = parge_args(args.__dict__)
@@ -2,6 +2,7 @@ import sys
 from multiprocessing import cpu_count
 from umdalib import __version__ as umdalib_version
 from umdalib.utils import NPARTITIONS, RAM_IN_GB
+from umdalib.utils.execution import execution_config
 
 
 def main(args=None):
@@ -13,4 +14,5 @@ def main(args=None):
         "cpu_count": cpu_count(),
         "ram": RAM_IN_GB,
         "npartitions": NPARTITIONS,
+        "dask": execution_config(),
     }
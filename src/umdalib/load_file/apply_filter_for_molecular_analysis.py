@@ -217,12 +217,13 @@ def main(args: Args):
         filtered_file_path.parent.mkdir(parents=True)
     final_analysis_df.to_csv(filtered_file_path)
 
+    index_column_name = data["index_column_name"]
     training_df: pd.DataFrame = read_as_ddf(
         data["filetype"],
         filename,
         data["key"],
+        filters=[(index_column_name, "in", final_analysis_df.index.tolist())],
     )
-    index_column_name = data["index_column_name"]
     training_df = training_df.set_index(index_column_name)
     logger.info(
         f"Index name: {training_df.index.name}\n{training_df.index.values[:10]=}\n{training_df.columns=}"
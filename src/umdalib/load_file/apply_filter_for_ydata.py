@@ -1,5 +1,9 @@
 from dataclasses import dataclass
 from pathlib import Path as pt
+
+import pyarrow as pa
+import pyarrow.dataset as pads
+
 from umdalib.load_file.read_data import read_as_ddf
 
 
@@ -14,13 +18,43 @@ class Args:
     property_column: str
 
 
+def as_bound(value) -> float | None:
+    # 0 is a bound, an empty field is not
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def is_numeric_parquet_column(filename: str, column: str) -> bool:
+    schema = pads.dataset(filename, format="parquet", partitioning="hive").schema
+    if column not in schema.names:
+        return False
+    dtype = schema.field(column).type
+    return pa.types.is_integer(dtype) or pa.types.is_floating(dtype)
+
+
 def main(args: Args):
+    min_yvalue = as_bound(args.min_yvalue)
+    max_yvalue = as_bound(args.max_yvalue)
+
+    # for a numeric parquet column the bounds are pushed down to the read,
+    # other columns are only comparable after the float cast below
+    filters = []
+    if args.filetype == "parquet" and is_numeric_parquet_column(
+        args.filename, args.property_column
+    ):
+        if min_yvalue is not None:
+            filters.append((args.property_column, ">=", min_yvalue))
+        if max_yvalue is not None:
+            filters.append((args.property_column, "<=", max_yvalue))
+
     df = read_as_ddf(
         args.filetype,
         args.filename,
         args.key,
         use_dask=args.use_dask,
         computed=True,
+        filters=filters,
     )
 
     filename = pt(args.filename)
@@ -32,14 +66,6 @@ def main(args: Args):
 
     df[args.property_column] = df[args.property_column].astype(float)
 
-    min_yvalue = None
-    max_yvalue = None
-
-    if args.min_yvalue:
-        min_yvalue = float(args.min_yvalue)
-    if args.max_yvalue:
-        max_yvalue = float(args.max_yvalue)
-
     # filter the y values based on the min and max values of property_column and make a new df
 
     if min_yvalue is None:
@@ -1,6 +1,7 @@
 import json
 import multiprocessing
 from collections import Counter
+from itertools import compress
 from dataclasses import dataclass
 from pathlib import Path as pt
 from typing import Literal
@@ -10,6 +11,11 @@ import pandas as pd
 from rdkit import Chem, RDLogger
 from rdkit.Chem import Descriptors, rdMolDescriptors
 
+from umdalib.load_file.molecule_store import (
+    get_molecule_store,
+    mol_from_binary,
+    mol_from_smiles,
+)
 from umdalib.load_file.read_data import read_as_ddf
 from umdalib.utils.json import safe_json_dump
 from umdalib.logger import logger
@@ -68,10 +74,38 @@ def categorize_molecule(mol):
         return "Inorganic"
 
 
+# columns of the analysis results, in order
+ANALYSIS_COLUMNS = [
+    "SMILES",
+    "MolecularWeight",
+    "No. of atoms",
+    "IsAromatic",
+    "IsNonCyclic",
+    "IsCyclicNonAromatic",
+    "Category",
+    "Elements",
+    "ElementCategories",
+    "total_rings",
+    "aromatic_rings",
+    "aliphatic_rings",
+    "saturated_rings",
+    "heterocycles",
+]
+
+
 def analyze_single_molecule(smi):
     """Analyze a single molecule."""
-    mol = Chem.MolFromSmiles(smi)
+    return analyze_mol(smi, mol_from_smiles(smi))
+
+
+def analyze_stored_molecule(item: tuple[str, bytes]) -> tuple:
+    """Analysis row (ANALYSIS_COLUMNS order) of a valid molecule of the store."""
+    smi, binary = item
+    result = analyze_mol(smi, mol_from_binary(binary))
+    return tuple(result[column] for column in ANALYSIS_COLUMNS)
 
+
+def analyze_mol(smi, mol: Chem.Mol | None):
     if mol is None:
         return None
 
@@ -96,6 +130,9 @@ def analyze_molecules(
     smiles_column_name: str,
     parallel=True,
     index_column_name: str = None,
+    filename: str = None,
+    filetype: str = None,
+    key: str = None,
 ):
     """Analyze a list of SMILES strings in parallel and return a DataFrame with results."""
 
@@ -104,44 +141,44 @@ def analyze_molecules(
 
     logger.info(f"Analyzing {len(smiles_list)} molecules...")
 
-    results = []
+    # parsed once per dataset, kept next to filename for the next analysis
+    store = get_molecule_store(
+        pd.Series(smiles_list, index=original_index),
+        filename,
+        smiles_column_name,
+    )
+    valid = store["valid"].to_numpy(dtype=bool)
+    if not valid.any():
+        logger.error("No valid molecules found.")
+        raise ValueError("No valid molecules found.")
+
+    # only valid molecules are analyzed, rows come back as tuples
+    items = list(zip(compress(smiles_list, valid), store["mol"].to_numpy()[valid]))
     if parallel:
         with multiprocessing.Pool(processes=multiprocessing.cpu_count() - 1) as pool:
-            results = pool.map(analyze_single_molecule, smiles_list)
-
-        results = np.array(results)
+            rows = pool.map(analyze_stored_molecule, items)
     else:
-        results = np.array(list(map(analyze_single_molecule, smiles_list)))
+        rows = list(map(analyze_stored_molecule, items))
 
-    if len(results) == 0:
-        logger.error("No valid molecules found.")
-        raise ValueError("No valid molecules found.")
-
-    # None values are returned for invalid SMILES strings
-    invalid_smiles_indices = np.where(results == None)[0]  # noqa: E711
+    df = pd.DataFrame.from_records(rows, columns=ANALYSIS_COLUMNS)
+    df.insert(0, index_column_name, training_df[index_column_name].to_numpy()[valid])
 
-    if len(invalid_smiles_indices) == 0:
+    if valid.all():
         logger.success("All molecules are valid.")
-        df = pd.DataFrame(results.tolist())
-        df.insert(0, index_column_name, original_index)
         return df
 
-    invalid_smiles = [smiles_list[i] for i in invalid_smiles_indices]
-    logger.warning(f"{len(invalid_smiles)} invalid molecules found.")
-
-    invalid_training_df = training_df.iloc[invalid_smiles_indices]
+    logger.warning(f"{np.count_nonzero(~valid)} invalid molecules found.")
+    invalid_training_df = training_df[~valid]
+    if filename and filetype:
+        # training_df only holds the SMILES and index, export the full rows
+        invalid_index = invalid_training_df[index_column_name].tolist()
+        invalid_training_df = read_as_ddf(
+            filetype,
+            filename,
+            key,
+            filters=[(index_column_name, "in", invalid_index)],
+        )
     invalid_training_df.to_csv(loc / "invalid_smiles_df.csv", index=False)
-
-    final_index = [
-        original_index[i]
-        for i in range(len(original_index))
-        if i not in invalid_smiles_indices
-    ]
-
-    results = results[results != None]  # noqa: E711
-    # add first column as index in results array
-    df = pd.DataFrame(results.tolist())
-    df.insert(0, index_column_name, final_index)
     return df
 
 
@@ -164,6 +201,29 @@ class Args:
     force: bool
 
 
+# compute() memoizes re-analysis of an existing analysis_file (force=True and
+# the initial analysis always run)
+CACHEABLE = True
+
+MODE_OUTPUT_FILES = {
+    "size_distribution": ["size_distribution.csv", "binned_size_distribution.csv"],
+    "structural_distribution": ["structural_distribution.csv"],
+    "elemental_distribution": ["elemental_distribution.csv"],
+}
+
+
+def get_cache_files(args: Args):
+    analysis_file = pt(args.analysis_file)
+    if args.force or not analysis_file.exists():
+        return None
+
+    if args.mode == "all":
+        output_files = sum(MODE_OUTPUT_FILES.values(), [])
+    else:
+        output_files = MODE_OUTPUT_FILES[args.mode]
+    return [analysis_file], [analysis_file.parent / name for name in output_files]
+
+
 def main(args: Args):
     global loc
 
@@ -201,6 +261,7 @@ def main(args: Args):
         args.key,
         use_dask=args.use_dask,
         computed=True,
+        columns=[args.smiles_column_name, args.index_column_name],
     )
 
     analysis_df = analyze_molecules(
@@ -208,6 +269,9 @@ def main(args: Args):
         args.smiles_column_name,
         parallel=True,
         index_column_name=args.index_column_name,
+        filename=args.filename,
+        filetype=args.filetype,
+        key=args.key,
     )
     logger.info(f"Analysis complete. {len(analysis_df)} valid molecules processed.")
 
@@ -0,0 +1,161 @@
+import json
+import multiprocessing
+import os
+from functools import lru_cache
+from pathlib import Path as pt
+
+import numpy as np
+import pandas as pd
+from rdkit import Chem, RDLogger
+
+from umdalib.logger import logger
+from umdalib.utils.fingerprint import file_fingerprint
+
+RDLogger.DisableLog("rdApp.*")
+
+# The SMILES of a dataset are parsed once (by worker processes) and kept next to
+# the source as ".<name>.<smiles column>.molecules.parquet", indexed by the
+# dataset index: SMILES, canonical SMILES, a valid flag and the RDKit Mol as a
+# binary pickle. Later stages read the parsed molecules instead of re-parsing
+# the text; the store is rebuilt when the source changes. Single SMILES are
+# parsed through a per-process LRU cache (mol_from_smiles).
+# Set UMDAPY_MOLECULE_STORE=0 to not keep the store on disk.
+MOLECULE_STORE_ENABLED = os.getenv("UMDAPY_MOLECULE_STORE", "1").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+MOLECULE_STORE_VERSION = 1
+PARSE_CHUNK_SIZE = 2000  # SMILES per worker task
+PARALLEL_MIN_SMILES = 5000  # fewer SMILES are parsed in this process
+MOL_CACHE_SIZE = 4096
+
+
+def clean_smiles(smi) -> str:
+    return str(smi).replace("\xa0", "").strip()
+
+
+def parse_smiles(smi) -> tuple[str, bool, bytes | None]:
+    """(canonical SMILES, valid, Mol binary); invalid SMILES keep their text"""
+    smi = clean_smiles(smi)
+    mol = Chem.MolFromSmiles(smi) if smi != "nan" else None
+    if mol is None:
+        return smi, False, None
+    return Chem.MolToSmiles(mol), True, mol.ToBinary()
+
+
+cached_parse = lru_cache(maxsize=MOL_CACHE_SIZE)(parse_smiles)
+
+
+def canonical_smiles(smi) -> str:
+    return cached_parse(clean_smiles(smi))[0]
+
+
+def mol_from_smiles(smi) -> Chem.Mol | None:
+    """Parsed smi (None if invalid), a new copy the caller may modify"""
+    _, valid, binary = cached_parse(clean_smiles(smi))
+    return Chem.Mol(binary) if valid else None
+
+
+def mol_from_binary(binary: bytes | None) -> Chem.Mol | None:
+    return Chem.Mol(binary) if binary is not None else None
+
+
+def parse_chunk(smiles: list) -> list[tuple[str, bool, bytes | None]]:
+    return [parse_smiles(smi) for smi in smiles]
+
+
+def parse_molecules(smiles: pd.Series, n_jobs: int = None) -> pd.DataFrame:
+    """Store frame of smiles: SMILES, canonical_smiles, valid and mol columns"""
+    values = smiles.tolist()
+    if len(values) < PARALLEL_MIN_SMILES:
+        parsed = parse_chunk(values)
+    else:
+        n_jobs = n_jobs or max(multiprocessing.cpu_count() - 1, 1)
+        chunks = [
+            values[i : i + PARSE_CHUNK_SIZE]
+            for i in range(0, len(values), PARSE_CHUNK_SIZE)
+        ]
+        with multiprocessing.Pool(processes=n_jobs) as pool:
+            parsed = [row for chunk in pool.map(parse_chunk, chunks) for row in chunk]
+
+    store = pd.DataFrame(
+        parsed, columns=["canonical_smiles", "valid", "mol"], index=smiles.index
+    )
+    store.insert(0, "SMILES", [str(smi) for smi in values])
+    return store
+
+
+def store_paths(filename: str | pt, smiles_column: str) -> tuple[pt, pt]:
+    source = pt(filename)
+    store_file = source.with_name(f".{source.name}.{smiles_column}.molecules.parquet")
+    return store_file, store_file.with_suffix(".json")
+
+
+def is_current(filename: str | pt, manifest_file: pt) -> bool:
+    try:
+        manifest = json.loads(manifest_file.read_text())
+    except (OSError, ValueError):
+        return False
+    if manifest.get("version") != MOLECULE_STORE_VERSION:
+        return False
+
+    stat = pt(filename).stat()
+    if (manifest["size"], manifest["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+        return True
+    # touched but not modified
+    return manifest["size"] == stat.st_size and (
+        file_fingerprint(filename)["sha256"] == manifest["sha256"]
+    )
+
+
+def write_store(filename: str | pt, smiles_column: str, store: pd.DataFrame):
+    store_file, manifest_file = store_paths(filename, smiles_column)
+    tmp_file = store_file.with_name(f"{store_file.name}.{os.getpid()}.tmp")
+    try:
+        store.to_parquet(tmp_file, index=True)
+        os.replace(tmp_file, store_file)
+    except Exception as e:
+        logger.warning(f"Could not write molecule store {store_file}: {e}")
+        tmp_file.unlink(missing_ok=True)
+        return
+
+    fingerprint = file_fingerprint(filename)
+    manifest = {
+        "version": MOLECULE_STORE_VERSION,
+        "source": fingerprint["path"],
+        "smiles_column": smiles_column,
+        "size": fingerprint["size"],
+        "mtime_ns": fingerprint["mtime_ns"],
+        "sha256": fingerprint["sha256"],
+    }
+    manifest_file.write_text(json.dumps(manifest, indent=4))
+    logger.success(f"Wrote molecule store {store_file}")
+
+
+def get_molecule_store(
+    smiles: pd.Series, filename: str | pt = None, smiles_column: str = None
+) -> pd.DataFrame:
+    """
+    Parsed molecules of smiles (indexed like it), read from the store of
+    filename / smiles_column when it is current, else parsed and stored
+    """
+    persist = MOLECULE_STORE_ENABLED and filename and pt(filename).is_file()
+    if persist:
+        store_file, manifest_file = store_paths(filename, smiles_column)
+        if store_file.exists() and is_current(filename, manifest_file):
+            store = pd.read_parquet(store_file)
+            # the same rows, e.g. not a filtered read of the source
+            if len(store) == len(smiles) and np.array_equal(
+                store.index.to_numpy(), smiles.index.to_numpy()
+            ):
+                logger.info(f"Using molecule store {store_file}")
+                return store
+            logger.info(f"Molecule store {store_file} has different rows")
+
+    logger.info(f"Parsing {len(smiles)} SMILES")
+    store = parse_molecules(smiles)
+    logger.info(f"{store['valid'].sum()}/{len(store)} valid molecules")
+    if persist:
+        write_store(filename, smiles_column, store)
+    return store
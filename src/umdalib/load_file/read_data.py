@@ -1,21 +1,131 @@
+import io
+import os
 from dataclasses import dataclass
-from multiprocessing import cpu_count
-from typing import Dict, Union
+from pathlib import Path as pt
+from typing import Dict, Iterator, Union
 
 import dask.dataframe as dd
-import numpy as np
 import pandas as pd
-from dask.diagnostics import ProgressBar
+import pyarrow as pa
+import pyarrow.dataset as pads
 
+from umdalib.load_file.sidecar import (
+    SIDECAR_ENABLED,
+    SIDECAR_FILETYPES,
+    get_sidecar,
+    write_sidecar,
+)
 from umdalib.logger import logger
+from umdalib.utils.execution import PARTITION_SIZE, dask_scheduler
+from umdalib.utils.job_context import DaskProgress
 
-NPARTITIONS = cpu_count() * 5
+SMI_CHUNKSIZE = 100_000  # rows per chunk in iter_smi_chunks
+
+# preview engine (read_data.main)
+DTYPE_SAMPLE_ROWS = 1000
+TAIL_BLOCK_SIZE = 64 * 1024
+SMALL_FILE_SIZE = 4 * 1024**2  # below this, text files are simply parsed whole
+
+# (filetype, path, key) -> (size, mtime_ns, rows)
+row_count_cache: dict[tuple, tuple[int, int, int]] = {}
+
+
+def smi_read_options(filename: str) -> dict:
+    """
+    read_csv options for a .smi file: one molecule per line, the SMILES being the
+    first whitespace-separated field (a name may follow), with an optional
+    "smiles" header line. "#" is not treated as a comment since it is the SMILES
+    triple bond (np.loadtxt used to cut "C#N" down to "C").
+    """
+    skiprows = 0
+    with open(filename) as f:
+        for line in f:
+            fields = line.split()
+            if fields:
+                if fields[0].lower() == "smiles":
+                    skiprows += 1
+                break
+            skiprows += 1
+
+    return {
+        "sep": r"\s+",
+        "header": None,
+        "names": ["SMILES"],
+        "usecols": [0],
+        "dtype": str,
+        "na_filter": False,
+        "skiprows": skiprows,
+    }
+
+
+def iter_smi_chunks(
+    filename: str, chunksize: int = SMI_CHUNKSIZE
+) -> Iterator[pd.DataFrame]:
+    """Stream a .smi file as DataFrames of at most chunksize rows"""
+    with pd.read_csv(
+        filename, chunksize=chunksize, **smi_read_options(filename)
+    ) as reader:
+        yield from reader
+
+
+# (column, op, value) filters, combined with AND as in pyarrow's filters=
+Filter = tuple[str, str, object]
+
+FILTER_OPS = {
+    "==": lambda col, value: col == value,
+    "=": lambda col, value: col == value,
+    "!=": lambda col, value: col != value,
+    "<": lambda col, value: col < value,
+    "<=": lambda col, value: col <= value,
+    ">": lambda col, value: col > value,
+    ">=": lambda col, value: col >= value,
+    "in": lambda col, value: col.isin(value),
+    "not in": lambda col, value: ~col.isin(value),
+}
+
+
+def apply_filters(ddf: Union[dd.DataFrame, pd.DataFrame], filters: list[Filter]):
+    mask = None
+    for column, op, value in filters:
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unknown filter operator: {op}")
+        column_mask = FILTER_OPS[op](ddf[column], value)
+        mask = column_mask if mask is None else mask & column_mask
+    return ddf if mask is None else ddf[mask]
+
+
+def check_columns(columns: list[str], available, filename: str):
+    missing = [column for column in columns if column not in available]
+    if missing:
+        raise ValueError(f"Columns {missing} not in {filename}")
 
 
 def read_as_ddf(
-    filetype: str, filename: str, key: str = None, computed=False, use_dask=False
+    filetype: str,
+    filename: str,
+    key: str = None,
+    computed=False,
+    use_dask=False,
+    columns: list[str] = None,
+    filters: list[Filter] = None,
+    use_sidecar: bool = True,
 ):
+    """
+    Read a data file with pandas (or dask if use_dask).
+    columns limits the columns read (parquet/hdf columns=, csv usecols=) and
+    filters, e.g. [("y", ">=", 0)], are pushed down to the parquet reader and
+    applied right after reading for the other formats.
+    CSV and JSON files are parsed once and then read from their parquet sidecar.
+    """
     logger.info(f"Reading {filename} as {filetype} using dask: {use_dask}")
+    filters = filters or None  # pyarrow rejects an empty filter list
+    read_columns = None
+    if columns:
+        columns = list(dict.fromkeys(column for column in columns if column))
+        logger.info(f"Reading columns: {columns}")
+        # columns that are filtered on must be read too (except for parquet)
+        filter_columns = [column for column, _, _ in filters or []]
+        read_columns = list(dict.fromkeys(columns + filter_columns))
 
     if not filetype:
         filetype = filename.split(".")[-1]
@@ -30,38 +140,246 @@ def read_as_ddf(
         logger.info(f"Using Pandas: {df_fn=}")
 
     ddf: Union[dd.DataFrame, pd.DataFrame] = None
+    source = filename
 
-    if filetype == "smi":
-        data = np.loadtxt(filename, dtype=str, ndmin=2)
-        if data[0][0].lower() == "smiles":
-            data = data[1:]
+    if use_sidecar and SIDECAR_ENABLED and filetype in SIDECAR_FILETYPES:
+        sidecar = get_sidecar(filename)
+        if sidecar is None:
+            reader = df_fn.read_csv if filetype == "csv" else df_fn.read_json
+            parsed = reader(filename)
+            sidecar = write_sidecar(filename, parsed)
+            if sidecar is None:
+                ddf = parsed
+        if sidecar is not None:
+            logger.info(f"Reading parquet sidecar {sidecar}")
+            filetype, filename = "parquet", str(sidecar)
 
-        ddf = pd.DataFrame(data, columns=["SMILES"])
+    if ddf is not None:
+        pass  # already parsed while trying to write the sidecar
+    elif filetype == "smi":
+        # streamed by the csv parser, dask reads it in PARTITION_SIZE partitions
         if use_dask:
-            ddf = dd.from_pandas(ddf)
+            ddf = dd.read_csv(
+                filename, blocksize=PARTITION_SIZE, **smi_read_options(filename)
+            )
+        else:
+            ddf = pd.read_csv(filename, **smi_read_options(filename))
 
         logger.info(f"Columns in the DataFrame: {ddf.columns.tolist()}")
     elif filetype == "csv":
-        ddf = df_fn.read_csv(filename)
+        if use_dask:
+            ddf = dd.read_csv(filename, usecols=read_columns, blocksize=PARTITION_SIZE)
+        else:
+            ddf = pd.read_csv(filename, usecols=read_columns)
     elif filetype == "parquet":
-        ddf = df_fn.read_parquet(filename)
+        if columns:
+            schema = pads.dataset(
+                filename, format="parquet", partitioning="hive"
+            ).schema
+            check_columns(columns, schema.names, source)
+        if use_dask:
+            ddf = dd.read_parquet(
+                filename, columns=columns, filters=filters, blocksize=PARTITION_SIZE
+            )
+        else:
+            ddf = pd.read_parquet(filename, columns=columns, filters=filters)
+        filters = None
     elif filetype == "hdf":
         if not key:
             raise ValueError("Key is required for HDF files")
-        ddf = df_fn.read_hdf(filename, key)
+        try:
+            ddf = df_fn.read_hdf(filename, key, columns=read_columns)
+        except TypeError:
+            # fixed format stores cannot select columns while reading
+            ddf = df_fn.read_hdf(filename, key)
     elif filetype == "json":
         ddf = df_fn.read_json(filename)
     else:
         raise ValueError(f"Unknown filetype: {filetype}")
 
+    if filters:
+        ddf = apply_filters(ddf, filters)
+    if columns and filetype != "smi":
+        check_columns(columns, ddf.columns, source)
+        ddf = ddf[columns]
+
     if computed and use_dask:
-        with ProgressBar():
+        with dask_scheduler("io"), DaskProgress(f"Reading {filename}"):
             ddf = ddf.compute()
 
     logger.info(f"{type(ddf)=}")
     return ddf
 
 
+def count_lines(filename: str) -> int:
+    """Number of lines, counted on raw bytes without decoding or parsing"""
+    lines = 0
+    last_byte = b"\n"
+    with open(filename, "rb") as f:
+        while block := f.read(1024 * 1024):
+            lines += block.count(b"\n")
+            last_byte = block[-1:]
+    if last_byte != b"\n":
+        lines += 1
+    return lines
+
+
+def read_last_lines(filename: str, n: int) -> list[bytes] | None:
+    """Last n non-empty lines read by seeking back from the end (None if that reaches the start)"""
+    with open(filename, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b""
+        while pos > 0 and data.rstrip(b"\r\n").count(b"\n") <= n:
+            step = min(TAIL_BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+
+    if pos == 0:
+        return None
+    lines = [line for line in data.splitlines()[1:] if line.strip()]
+    return lines[-n:]
+
+
+def count_rows(filetype: str, filename: str, key: str = None) -> int:
+    """
+    Row count from parquet metadata, the HDF table index or a raw newline count
+    for text files (no parsing), cached per file until its size or mtime changes.
+    Quoted values spanning several lines make the CSV count an over-estimate.
+    """
+    path = pt(filename).resolve()
+    stat = path.stat()
+    cache_key = (filetype, str(path), key)
+    cached = row_count_cache.get(cache_key)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+
+    if filetype == "parquet":
+        rows = pads.dataset(filename, format="parquet").count_rows()
+    elif filetype == "csv":
+        rows = max(count_lines(filename) - 1, 0)  # header
+    elif filetype == "smi":
+        rows = max(count_lines(filename) - smi_read_options(filename)["skiprows"], 0)
+    elif filetype == "hdf":
+        with pd.HDFStore(filename, mode="r") as store:
+            rows = store.get_storer(key).nrows
+        if rows is None:
+            rows = len(pd.read_hdf(filename, key))
+    else:
+        rows = len(read_as_ddf(filetype, filename, key))
+
+    row_count_cache[cache_key] = (stat.st_size, stat.st_mtime_ns, int(rows))
+    return int(rows)
+
+
+def read_parquet_rows(filename: str, count: int, where: str) -> pd.DataFrame:
+    """
+    First/last rows of a parquet file or dataset directory, reading only the
+    row groups needed
+    """
+    dataset = pads.dataset(filename, format="parquet", partitioning="hive")
+    if where == "head":
+        table = dataset.head(max(count, 0))
+    else:
+        row_groups, rows = [], 0
+        for fragment in reversed(list(dataset.get_fragments())):
+            for row_group in reversed(fragment.split_by_row_group()):
+                row_groups.insert(0, row_group)
+                rows += row_group.count_rows()
+                if rows >= count:
+                    break
+            if rows >= count:
+                break
+        tables = [row_group.to_table(schema=dataset.schema) for row_group in row_groups]
+        table = pa.concat_tables(tables) if tables else dataset.schema.empty_table()
+
+    # keep the pandas metadata (index, dtypes) of the files
+    table = table.replace_schema_metadata(dataset.schema.metadata)
+    rows = table.to_pandas()
+    if where == "head":
+        return rows.head(count)
+
+    rows = rows.tail(count)
+    if isinstance(rows.index, pd.RangeIndex):
+        # a default index restarts at 0 in the row groups read, number the
+        # rows as a full read of the dataset would
+        total = dataset.count_rows()
+        rows.index = pd.RangeIndex(total - len(rows), total)
+    return rows
+
+
+def read_text_rows(filetype: str, filename: str, count: int, where: str):
+    """
+    First/last rows of a csv or smi file without parsing the rest of it.
+    Returns the rows and a sample of DTYPE_SAMPLE_ROWS rows for the dtypes.
+    """
+    options = smi_read_options(filename) if filetype == "smi" else {}
+    small_file = os.path.getsize(filename) < SMALL_FILE_SIZE
+
+    sample = pd.read_csv(
+        filename, nrows=None if small_file else max(count, DTYPE_SAMPLE_ROWS), **options
+    )
+    if where == "head" or small_file:
+        rows = sample.head(count) if where == "head" else sample.tail(count)
+        return rows, sample
+
+    lines = read_last_lines(filename, count)
+    if lines is None:
+        return pd.read_csv(filename, **options).tail(count), sample
+
+    options = options | {"header": None, "names": sample.columns, "skiprows": 0}
+    rows = pd.read_csv(io.BytesIO(b"\n".join(lines)), **options)
+    return rows, sample
+
+
+def read_preview(
+    filetype: str,
+    filename: str,
+    key: str = None,
+    count: int = 10,
+    where: str = "head",
+    use_dask: bool = False,
+):
+    """(rows, total row count, sampled dtypes) without loading the whole file"""
+    if not filetype:
+        filetype = filename.split(".")[-1]
+
+    if filetype in SIDECAR_FILETYPES and SIDECAR_ENABLED:
+        sidecar = get_sidecar(filename)
+        if sidecar is not None:
+            filetype, filename = "parquet", str(sidecar)
+
+    try:
+        if filetype in ("csv", "smi"):
+            rows, sample = read_text_rows(filetype, filename, count, where)
+        elif filetype == "parquet":
+            rows = read_parquet_rows(filename, count, where)
+            sample = rows
+        elif filetype == "hdf":
+            if not key:
+                raise ValueError("Key is required for HDF files")
+            nrows = count_rows(filetype, filename, key)
+            start, stop = (0, count) if where == "head" else (nrows - count, nrows)
+            rows = pd.read_hdf(filename, key, start=max(start, 0), stop=stop)
+            sample = rows
+        else:
+            raise NotImplementedError(filetype)
+
+        total_rows = count_rows(filetype, filename, key)
+    except (NotImplementedError, TypeError, pd.errors.ParserError) as e:
+        logger.warning(f"Falling back to a full read for the preview: {e!r}")
+        ddf = read_as_ddf(filetype, filename, key, use_dask=use_dask)
+        rows = ddf.head(count) if where == "head" else ddf.tail(count)
+        sample = rows
+        total_rows = ddf.shape[0]
+        if use_dask:
+            with dask_scheduler("io"):
+                total_rows = total_rows.compute()
+
+    dtypes = {str(column): str(dtype) for column, dtype in sample.dtypes.items()}
+    return rows, int(total_rows), dtypes
+
+
 @dataclass
 class Args:
     filename: str
@@ -71,33 +389,38 @@ class Args:
     use_dask: bool
 
 
+# compute() memoizes the result until the file changes
+CACHEABLE = True
+
+
+def get_cache_files(args: Args):
+    return [args.filename], []
+
+
 def main(args: Args):
     logger.info(f"Reading {args.filename} as {args.filetype}")
     logger.info(f"Using Dask: {args.use_dask}")
 
-    ddf = read_as_ddf(args.filetype, args.filename, args.key, use_dask=args.use_dask)
-    logger.info(f"{type(ddf)=}")
-
-    shape = ddf.shape[0]
-    if args.use_dask:
-        shape = shape.compute()
+    count = int(args.rows["value"])
+    with dask_scheduler("io"), DaskProgress("Reading rows"):
+        nrows, shape, dtypes = read_preview(
+            args.filetype,
+            args.filename,
+            args.key,
+            count=count,
+            where=args.rows["where"],
+            use_dask=args.use_dask,
+        )
     logger.info(f"read_data file: Shape: {shape}")
 
     data = {
-        "columns": ddf.columns.values.tolist(),
+        "columns": nrows.columns.values.tolist(),
+        "nrows": nrows.fillna("").to_dict(orient="records"),
+        "shape": shape,
+        "index_name": nrows.index.name,
+        "dtypes": dtypes,
     }
 
-    count = int(args.rows["value"])
-
-    with ProgressBar():
-        if args.rows["where"] == "head":
-            nrows = ddf.head(count).fillna("")
-        elif args.rows["where"] == "tail":
-            nrows = ddf.tail(count).fillna("")
-        data["nrows"] = nrows.to_dict(orient="records")
-        data["shape"] = shape
-        data["index_name"] = ddf.index.name
-
     logger.info(f"{type(data)=}")
 
     return data
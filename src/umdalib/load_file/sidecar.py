@@ -0,0 +1,114 @@
+import json
+import os
+import shutil
+from pathlib import Path as pt
+
+import dask.dataframe as dd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from umdalib.logger import logger
+from umdalib.utils.fingerprint import file_fingerprint
+
+# CSV/JSON files are parsed once and kept as a typed parquet copy next to the
+# source (".<name>.sidecar.parquet"), which read_as_ddf uses while the source
+# is unchanged. Set UMDAPY_SIDECAR=0 to always parse the source.
+SIDECAR_ENABLED = os.getenv("UMDAPY_SIDECAR", "1").lower() in ("1", "true", "yes")
+SIDECAR_FILETYPES = ("csv", "json")
+SIDECAR_VERSION = 1
+
+# sources that could not be stored as parquet (e.g. mixed-type columns),
+# as (path, size, mtime_ns), so they are not retried on every read
+unsupported_sources: set[tuple[str, int, int]] = set()
+
+
+def sidecar_paths(filename: str | pt) -> tuple[pt, pt]:
+    source = pt(filename)
+    sidecar = source.with_name(f".{source.name}.sidecar.parquet")
+    return sidecar, sidecar.with_suffix(".json")
+
+
+def source_state(filename: str | pt) -> tuple[str, int, int]:
+    stat = pt(filename).stat()
+    return str(pt(filename).resolve()), stat.st_size, stat.st_mtime_ns
+
+
+def get_sidecar(filename: str | pt) -> pt | None:
+    """The sidecar of filename if it is still up to date, else None"""
+    sidecar, manifest_file = sidecar_paths(filename)
+    if not (sidecar.exists() and manifest_file.exists()):
+        return None
+
+    try:
+        manifest = json.loads(manifest_file.read_text())
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != SIDECAR_VERSION:
+        return None
+
+    _, size, mtime_ns = source_state(filename)
+    if (manifest["size"], manifest["mtime_ns"]) == (size, mtime_ns):
+        return sidecar
+
+    # touched but not modified: the content hash still matches
+    if manifest["size"] == size:
+        if file_fingerprint(filename)["sha256"] == manifest["sha256"]:
+            manifest["mtime_ns"] = mtime_ns
+            manifest_file.write_text(json.dumps(manifest, indent=4))
+            return sidecar
+
+    logger.info(f"Sidecar of {filename} is stale")
+    return None
+
+
+def write_partitions(ddf: dd.DataFrame, path: pt):
+    """
+    Write ddf into one parquet file, a partition (row group) at a time. The
+    per-partition indices of a parsed file are dropped, so the sidecar reads
+    back like the source parsed with pandas (a default RangeIndex).
+    """
+    schema = pa.Schema.from_pandas(ddf._meta, preserve_index=False)
+    with pq.ParquetWriter(path, schema) as writer:
+        for partition in ddf.partitions:
+            table = pa.Table.from_pandas(partition.compute(), preserve_index=False)
+            writer.write_table(table.cast(schema))
+
+
+def write_sidecar(filename: str | pt, df: pd.DataFrame | dd.DataFrame) -> pt | None:
+    """Store the parsed source as parquet (with its index) next to it"""
+    state = source_state(filename)
+    if state in unsupported_sources:
+        return None
+
+    sidecar, manifest_file = sidecar_paths(filename)
+    tmp_path = sidecar.with_name(f"{sidecar.name}.{os.getpid()}.tmp")
+    try:
+        if isinstance(df, dd.DataFrame):
+            write_partitions(df, tmp_path)
+        else:
+            df.to_parquet(tmp_path, index=True)
+
+        if sidecar.is_dir():
+            shutil.rmtree(sidecar)
+        os.replace(tmp_path, sidecar)
+    except Exception as e:
+        logger.warning(f"Could not write parquet sidecar for {filename}: {e}")
+        unsupported_sources.add(state)
+        if tmp_path.is_dir():
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        else:
+            tmp_path.unlink(missing_ok=True)
+        return None
+
+    fingerprint = file_fingerprint(filename)
+    manifest = {
+        "version": SIDECAR_VERSION,
+        "source": fingerprint["path"],
+        "size": fingerprint["size"],
+        "mtime_ns": fingerprint["mtime_ns"],
+        "sha256": fingerprint["sha256"],
+    }
+    manifest_file.write_text(json.dumps(manifest, indent=4))
+    logger.success(f"Wrote parquet sidecar {sidecar}")
+    return sidecar
@@ -26,6 +26,37 @@ class Args:
     ytransformation: str
 
 
+# compute() memoizes the result until the file or the saved json files change
+CACHEABLE = True
+
+
+def get_savefilename(savefilename: str, ytransformation: str = None) -> str:
+    """Name of the analysis results file (of the transformed data)"""
+    if not savefilename.endswith(".json"):
+        savefilename += ".json"
+    if ytransformation:
+        savefilename = savefilename.replace(".json", "")
+        savefilename += f"_for_{ytransformation}_transformation.json"
+    return savefilename
+
+
+def get_cache_files(args: Args):
+    # the auto transformation (and so the files written) depends on the data
+    if not args.save_loc or args.auto_transform_data:
+        return None
+    save_loc = pt(args.save_loc)
+    output_files = [
+        (save_loc / args.savefilename).with_suffix(".json"),
+        save_loc / get_savefilename(args.savefilename, args.ytransformation),
+        save_loc / "original_y_data.json",
+    ]
+    if args.ytransformation:
+        output_files.append(
+            save_loc / f"{args.ytransformation}_y_transformed_data.json"
+        )
+    return [args.filename], list(dict.fromkeys(output_files))
+
+
 boxcox_lambda_param = None
 
 
@@ -215,6 +246,7 @@ def main(args: Args):
         args.key,
         use_dask=args.use_dask,
         computed=True,
+        columns=[args.property_column],
     )
 
     # Assuming your target property is named 'property'
@@ -271,15 +303,7 @@ def main(args: Args):
         analysis_results["boxcox_lambda"] = None
 
     # Save the analysis results
-    savefilename = args.savefilename
-    if not savefilename.endswith(".json"):
-        savefilename += ".json"
-
-    if ytransformation:
-        savefilename = savefilename.replace(".json", "")
-        savefilename += f"_for_{ytransformation}_transformation.json"
-
-    savefile = save_loc / savefilename
+    savefile = save_loc / get_savefilename(args.savefilename, ytransformation)
     safe_json_dump(analysis_results, savefile)
 
     # save the transformed data
@@ -1,15 +1,22 @@
 from dataclasses import dataclass
 from pathlib import Path as pt
 from time import perf_counter
-from typing import Callable, Literal, List, Union
+from typing import Callable, Literal, Union
 
 import numpy as np
 from dask import array as da
-from dask.diagnostics import ProgressBar
-from mol2vec import features
-from rdkit import Chem
 from umdalib.load_file.read_data import read_as_ddf
 from umdalib.utils.computation import load_model
+import dask
+from umdalib.vectorize_molecules.chunked import embed_in_chunks
+from umdalib.vectorize_molecules.mol2vec_batch import (
+    mol2vec_partition,
+    mol2vec_vectors,
+)
+from umdalib.vectorize_molecules.vicgae_pool import vicgae_vectors
+from umdalib.vectorize_molecules.embedding_cache import get_embedding_cache, model_hash
+from umdalib.utils.execution import dask_scheduler, embedding_workload, repartition
+from umdalib.utils.job_context import DaskProgress
 from umdalib.utils.json import safe_json_dump
 from umdalib.logger import logger
 import pandas as pd
@@ -47,7 +54,7 @@ class Args:
     PCA_pipeline_location: str
     embedd_savefile: str
     vectors_file: str
-    use_dask: bool
+    use_dask: bool  # dask runs skip the embedding cache and resumable shards
     index_col: str
 
 
@@ -68,49 +75,17 @@ def VICGAE2vec(smi: str, model):
 test_mode = False
 
 
-def mol2vec(smi: str, model, radius=1) -> List[np.ndarray]:
+def mol2vec(smi: str, model, radius=1) -> np.ndarray:
     """
     Given a model, convert a SMILES string into the corresponding
     NumPy vector.
     """
-
-    # global invalid_smiles
-    smi = str(smi).replace("\xa0", "")
     if test_mode:
         logger.info(f"{smi=}")
-    if smi == "nan":
-        # invalid_smiles.append(smi)
-        return np.zeros(model.vector_size)
-
-    # Molecule from SMILES will break on "bad" SMILES; this tries
-    # to get around sanitization (which takes a while) if it can
-    try:
-        mol = Chem.MolFromSmiles(smi, sanitize=False)
-        if test_mode:
-            logger.info(f"{mol=}")
-        # if not mol:
-        #     invalid_smiles.append(str(smi))
-
-        mol.UpdatePropertyCache(strict=False)
-        Chem.GetSymmSSSR(mol)
-        # generate a sentence from rdkit molecule
-        sentence = features.mol2alt_sentence(mol, radius)
-        # generate vector embedding from sentence and model
-        vector = features.sentences2vec([sentence], model)
-        if test_mode:
-            logger.info(f"{vector.shape=}")
-
-        vector = vector.reshape(-1)
-        if len(vector) == 1:
-            # return np.zeros(model.vector_size)
-            logger.error(f"Vector length is {len(vector)} for {smi}")
-            raise ValueError(f"Invalid embedding: {smi}")
-        return vector
-
-    except Exception as _:
-        # if smi not in invalid_smiles and isinstance(smi, str):
-        #     invalid_smiles.append(smi)
-        return np.zeros(model.vector_size)
+    vector = mol2vec_vectors([smi], model, radius)[0]
+    if test_mode:
+        logger.info(f"{vector.shape=}")
+    return vector
 
 
 smi_to_vec_dict: dict[str, Callable] = {
@@ -190,36 +165,27 @@ def main(args: Args):
     fullfile = pt(args.filename)
     logger.info(f"Reading {fullfile} as {args.filetype}")
 
-    ddf = read_as_ddf(args.filetype, args.filename, args.key, use_dask=args.use_dask)
+    ddf = read_as_ddf(
+        args.filetype,
+        args.filename,
+        args.key,
+        use_dask=args.use_dask,
+        columns=[args.columnX, args.columnY, args.index_col],
+    )
 
     if args.index_col:
         ddf = ddf.set_index(args.index_col)
 
+    workload = embedding_workload(args.embedding)
     if args.use_dask:
-        logger.info(f"{args.npartitions=}")
-        ddf = ddf.repartition(npartitions=args.npartitions)
+        ddf = repartition(ddf, args.filename, workload)
 
-    vectors = None
     logger.info(f"Using {args.embedding} for embedding")
 
     logger.info(f"Using {smi_to_vector} for embedding")
     if not callable(smi_to_vector):
         raise ValueError(f"Unknown embedding model: {args.embedding}")
 
-    if args.use_dask:
-        vectors = ddf[args.columnX].apply(
-            smi_to_vector, args=(model,), meta=(None, np.float32)
-        )
-    else:
-        # for some reason, mapply is not faster with mol2vec embeddings
-        if args.embedding == "mol2vec":
-            vectors = ddf[args.columnX].apply(smi_to_vector, args=(model,))
-        else:
-            vectors = ddf[args.columnX].mapply(smi_to_vector, args=(model,))
-
-    if vectors is None:
-        raise ValueError(f"Unknown embedding model: {args.embedding}")
-
     vectors_file = pt(args.vectors_file)
     embedding_loc = vectors_file.parent
     if not embedding_loc.exists():
@@ -232,19 +198,57 @@ def main(args: Args):
     y = y.apply(convert_to_float)
     vec_computed: np.ndarray = None
 
-    with ProgressBar():
-        if args.use_dask:
-            if isinstance(vectors, da.Array):
-                vec_computed = vectors.compute()
-            y = y.compute()
+    if args.use_dask:
+        # embedded partition by partition in one dask graph, the embedding
+        # cache and shard checkpoints of embed_in_chunks are not used
+        logger.warning("Embedding with dask: results are not cached or resumable")
+        if smi_to_vector is mol2vec:
+            # the model is loaded by each worker, not pickled into every task
+            vectors = ddf[args.columnX].map_partitions(
+                mol2vec_partition,
+                str(args.pretrained_model_location),
+                meta=(None, object),
+            )
         else:
-            vec_computed = vectors
-
-        # logger.info(f"{vec_computed.shape=}")
+            vectors = ddf[args.columnX].apply(
+                smi_to_vector, args=(model,), meta=(None, np.float32)
+            )
+        # one pass over the partitions for both the vectors and y
+        with DaskProgress("Computing embeddings"), dask_scheduler(workload):
+            vec_computed, y = dask.compute(vectors, y)
         vec_computed = np.vstack(vec_computed)
-
         np.save(vectors_file, vec_computed)
         logger.success(f"Embedded numpy array saved to {vectors_file}")
+    else:
+
+        def embed_chunk(smiles: pd.Series):
+            if smi_to_vector is mol2vec:
+                return mol2vec_vectors(smiles, model)  # batched, not per row
+            if smi_to_vector is VICGAE2vec:
+                # model loaded once per worker process, SMILES sent in blocks
+                return vicgae_vectors(smiles, args.pretrained_model_location, model)
+            return smiles.mapply(smi_to_vector, args=(model,))
+
+        # written shard by shard, an interrupted run resumes where it stopped
+        vec_computed = embed_in_chunks(
+            ddf[args.columnX],
+            embed_chunk,
+            vectors_file,
+            run_key=(
+                args.embedding,
+                args.pretrained_model_location,
+                args.PCA_pipeline_location,
+            ),
+            cache=get_embedding_cache(
+                args.embedding,
+                args.pretrained_model_location,
+                variant=(
+                    f"pca:{model_hash(args.PCA_pipeline_location)}"
+                    if args.PCA_pipeline_location
+                    else ""
+                ),
+            ),
+        )
 
     logger.info(f"{vec_computed.shape=}")
 
@@ -289,7 +293,7 @@ def main(args: Args):
         "filename": args.filename,
         "filetype": args.filetype,
         "key": args.key,
-        "npartitions": args.npartitions,
+        "npartitions": ddf.npartitions if args.use_dask else None,
         "columnX": args.columnX,
         "data_shape": vec_computed.shape,
         "invalid_smiles": len(invalid_smiles),
@@ -40,9 +40,19 @@ from umdalib.load_file.read_data import read_as_ddf
 from umdalib.ml_training.utils import Yscalers, get_transformed_data
 
 # from umdalib.utils.computation import load_model
+from umdalib.utils.job_context import (
+    JobCancelled,
+    checkpoint_key,
+    clear_checkpoint,
+    is_cancelled,
+    load_checkpoint,
+    save_checkpoint,
+    track_progress,
+)
 from umdalib.utils.json import safe_json_dump
 
 from .ml_utils.ml_plots import learning_curve_plot, main_plot
+from .ml_utils.processed_data import get_sources, load_processed, save_processed
 from .ml_utils.ml_types import DataType, LearningCurve, LearningCurveData, MLResults
 from .ml_utils.utils import grid_search_dict
 from .ml_utils.models import models_dict, n_jobs_keyword_available_models, kernels_dict
@@ -304,8 +314,23 @@ def optuna_optimize(
     # Define the base study name
     base_study_name = f"{loaded_training_file.stem}_{pre_trained_file.stem}"
 
+    # A study interrupted by cancellation is picked up again when the same
+    # optimization is re-enqueued
+    checkpoint = checkpoint_key(
+        "optuna",
+        storage,
+        str(loaded_training_file),
+        str(pre_trained_file),
+        current_model_name,
+        args.parameters,
+        args.fine_tuned_values,
+        optuna_n_trials,
+    )
+    interrupted_study_name = load_checkpoint(checkpoint)
+    resume = bool(args.optuna_resume_study["resume"])
+
     # Get a unique study name
-    if args.optuna_resume_study["resume"]:
+    if resume:
         study_name = base_study_name
         study_id = args.optuna_resume_study["id"]
         if study_id:
@@ -317,6 +342,10 @@ def optuna_optimize(
         if study_name not in existing_names:
             raise ValueError(f"Study with ID: {study_id} not found")
         logger.info(f"Resuming study with ID: {study_id}")
+    elif interrupted_study_name:
+        study_name = interrupted_study_name
+        resume = True
+        logger.info(f"Resuming interrupted study: {study_name}")
     else:
         study_name = get_unique_study_name(base_study_name, storage)
 
@@ -327,8 +356,15 @@ def optuna_optimize(
         direction="minimize",
         study_name=study_name,
         storage=storage,
-        load_if_exists=args.optuna_resume_study["resume"],
+        load_if_exists=resume,
     )
+    save_checkpoint(checkpoint, study_name)
+
+    n_trials = optuna_n_trials
+    if interrupted_study_name and not args.optuna_resume_study["resume"]:
+        finished_trials = [t for t in study.trials if t.state.is_finished()]
+        n_trials = max(optuna_n_trials - len(finished_trials), 0)
+        logger.info(f"{len(finished_trials)} trials already finished")
 
     static_params = {}
     for key, value in args.parameters.items():
@@ -378,7 +414,24 @@ def optuna_optimize(
         },
     )
     logger.info("Optimizing hyperparameters using Optuna")
-    study.optimize(objective, n_trials=optuna_n_trials, n_jobs=n_jobs)
+    with track_progress(n_trials, "Optuna trials") as progress:
+
+        def report_trial(study: optuna.study.Study, trial: optuna.trial.FrozenTrial):
+            progress.update(message=f"trial {trial.number}: {trial.state.name}")
+            if is_cancelled():
+                logger.warning("Cancelled: stopping Optuna after the current trial")
+                study.stop()
+
+        study.optimize(
+            objective, n_trials=n_trials, n_jobs=n_jobs, callbacks=[report_trial]
+        )
+
+    if is_cancelled():
+        raise JobCancelled(
+            f"Optuna study {study_name} stopped after {len(study.trials)} trials, "
+            "run it again to resume"
+        )
+    clear_checkpoint(checkpoint)
     logger.info("Optuna - optimization complete")
 
     logger.info("Number of finished trials:", len(study.trials))
@@ -803,7 +856,7 @@ def analyse_shap_values(
     # Create a dictionary with all necessary data
     data = {
         "feature_names": explainer.feature_names or feature_names,
-        "shap_values": shap_values_array.tolist(),
+        "shap_values": shap_values_array,
         # "feature_values": X.tolist(),
         # "mean_abs_shap": mean_abs_shap.tolist(),
     }
@@ -1282,29 +1335,59 @@ loaded_training_file: pt = None
 final_df: pd.DataFrame = None
 
 
+# rows per block when scanning a memory-mapped feature matrix
+MASK_CHUNK_ROWS = 65_536
+
+
+def load_vectors(vectors_file: str) -> np.ndarray:
+    """
+    Memory-map a numeric (n_samples, n_features) .npy file. Object arrays of
+    per-row vectors cannot be mapped and are stacked into floats once.
+    """
+    try:
+        X = np.load(vectors_file, mmap_mode="r")
+    except ValueError:
+        logger.info("Vectors are stored as objects, stacking them")
+        X = np.load(vectors_file, allow_pickle=True)
+        X = np.vstack(X) if X.ndim == 1 else X
+
+    if X.dtype.kind not in "f":
+        X = X.astype(float)
+    logger.info(f"Loaded vectors: {X.shape=}, {X.dtype=}")
+    return X
+
+
+def nonzero_rows(X: np.ndarray, chunk_rows: int = MASK_CHUNK_ROWS) -> np.ndarray:
+    """Rows of X with any non-zero feature, scanned in blocks of chunk_rows"""
+    mask = np.empty(X.shape[0], dtype=bool)
+    for start in range(0, X.shape[0], chunk_rows):
+        block = X[start : start + chunk_rows]
+        mask[start : start + chunk_rows] = np.any(block != 0, axis=1)
+    return mask
+
+
 def get_data(args: Args) -> Tuple[np.ndarray, np.ndarray]:
     global yscaler, boxcox_lambda_param, y_transformer, final_df
 
-    processed_df_file = processed_vectors_file_dir / "processed_df.parquet"
-    if processed_df_file.exists():
-        logger.info(f"Loading processed data from {processed_df_file}")
-        final_df = pd.read_parquet(processed_df_file)
-        X = final_df.iloc[:, 2:].to_numpy()
+    columns = [
+        args.index_col,
+        args.training_column_name_X,
+        args.training_column_name_y,
+    ]
+    sources = get_sources(args.vectors_file, args.training_file, columns)
+    processed = load_processed(processed_vectors_file_dir, sources)
+    if processed is not None:
+        X, final_df = processed
         y = final_df["y"].to_numpy()
         logger.success(
-            f"Processed data loaded from {processed_df_file}\n{X.shape=}, {y.shape=}"
+            f"Processed data loaded from {processed_vectors_file_dir}\n"
+            f"{X.shape=}, {y.shape=}"
         )
     else:
         logger.info("Loading data")
-        X = np.load(args.vectors_file, allow_pickle=True)
-        X = np.array(X, dtype=float)
+        X = load_vectors(args.vectors_file)
         original_length = X.shape[0]
 
-        # stack the arrays (n_samples, n_features)
-        if len(X.shape) == 1:
-            logger.info("Reshaping X")
-            X = np.vstack(X)
-
         # load training data from file
         ddf: pd.DataFrame = read_as_ddf(
             args.training_file["filetype"],
@@ -1312,52 +1395,50 @@ def get_data(args: Args) -> Tuple[np.ndarray, np.ndarray]:
             args.training_file["key"],
             use_dask=args.use_dask,
             computed=True,
+            columns=columns,
         )
         ddf.set_index(args.index_col, inplace=True)
         logger.info(f"{ddf.columns=}")
+        if len(ddf) != original_length:
+            raise ValueError(
+                f"{args.vectors_file} has {original_length} rows, "
+                f"training file has {len(ddf)}"
+            )
 
-        # Create DataFrame with feature columns
-        feature_cols = [str(i) for i in range(X.shape[1])]
-        data_df = pd.DataFrame(X, index=ddf.index, columns=feature_cols)
-
-        # Add SMILES and y columns
-        data_df.loc[:, args.training_column_name_X] = ddf[args.training_column_name_X]
-        data_df.loc[:, "y"] = pd.to_numeric(
-            ddf[args.training_column_name_y], errors="coerce"
-        )
-
-        # Reorder columns
-        cols_order = [args.training_column_name_X, "y"] + feature_cols
-        data_df = data_df[cols_order]
-
-        # Filter data efficiently using numpy operations
-        features = data_df.iloc[:, 2:].to_numpy()
-        y_values = data_df["y"].to_numpy()
+        y = pd.to_numeric(ddf[args.training_column_name_y], errors="coerce")
+        y = y.to_numpy(dtype=float)
 
         # Create masks
-        non_zero_mask = np.any(features != 0, axis=1)
-        valid_y_mask = ~(np.isnan(y_values) | np.isinf(y_values))
+        non_zero_mask = nonzero_rows(X)
+        valid_y_mask = np.isfinite(y)
         final_mask = non_zero_mask & valid_y_mask
 
-        # Apply final filtering
-        final_df = data_df[final_mask]
-        final_df.to_parquet(processed_df_file, compression="snappy")
-        logger.success(f"Processed data saved to {processed_df_file}")
+        # Apply final filtering: X is only copied (once) if rows are dropped
+        all_valid = final_mask.all()
+        if all_valid:
+            logger.info("No invalid values found in X and y")
+            with open(processed_vectors_file_dir / ".all_valid", "w") as f:
+                f.write("All valid values")
+        else:
+            valid_rows = np.flatnonzero(final_mask)
+            X, y = X[valid_rows], y[valid_rows]
+
+        final_df = ddf.loc[final_mask, [args.training_column_name_X]]
+        final_df["y"] = y
+        save_processed(
+            processed_vectors_file_dir,
+            sources,
+            X,
+            final_df,
+            copy_X=not (all_valid and isinstance(X, np.memmap)),
+        )
 
         # Print statistics
-        logger.info(f"Original number of rows: {len(data_df)}")
+        logger.info(f"Original number of rows: {original_length}")
         logger.info(f"Rows removed due to all-zero features: {np.sum(~non_zero_mask)}")
         logger.info(f"Rows removed due to invalid y values: {np.sum(~valid_y_mask)}")
         logger.info(f"Final number of rows: {len(final_df)}")
 
-        if np.sum(~final_mask) == 0:
-            logger.info("No invalid values found in X and y")
-            with open(processed_vectors_file_dir / ".all_valid", "w") as f:
-                f.write("All valid values")
-
-        X = final_df.iloc[:, 2:].to_numpy()
-        y = final_df["y"].to_numpy()
-
         X_validated_length = original_length - np.sum(~non_zero_mask)
         final_length = len(final_df)
 
@@ -1475,6 +1556,11 @@ def main(args: Args):
         seed, \
         processed_vectors_file_dir
 
+    # module globals persist between calls now that compute() keeps modules resident
+    seed = None
+    n_jobs = 1
+    backend = "threading"
+
     if args.seed:
         seed = int(args.seed)
 
@@ -1486,7 +1572,7 @@ def main(args: Args):
     logfile = pre_trained_loc / f"{pre_trained_file.stem}.log"
     logger.info(f"Logging to {logfile}")
 
-    logger.add(
+    log_handler_id = logger.add(
         logfile,
         rotation="10 MB",
         compression="zip",
@@ -1524,16 +1610,19 @@ def main(args: Args):
             f"Created directory: {processed_vectors_file_dir} for saving processed vectors"
         )
 
-    X, y = get_data(args)
+    try:
+        X, y = get_data(args)
 
-    results = None
+        results = None
 
-    if args.parallel_computation:
-        with parallel_config(backend, n_jobs=n_jobs):
-            logger.info(f"Using {n_jobs} jobs with {backend} backend")
+        if args.parallel_computation:
+            with parallel_config(backend, n_jobs=n_jobs):
+                logger.info(f"Using {n_jobs} jobs with {backend} backend")
+                results = compute(args, X, y)
+        else:
+            logger.info("Running in serial mode")
             results = compute(args, X, y)
-    else:
-        logger.info("Running in serial mode")
-        results = compute(args, X, y)
 
-    return results
+        return results
+    finally:
+        logger.remove(log_handler_id)
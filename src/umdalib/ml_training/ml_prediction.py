@@ -7,6 +7,10 @@ import pandas as pd
 from joblib import load
 
 from umdalib.ml_training.embedd_data import smi_to_vec_dict
+from umdalib.vectorize_molecules.embedding_cache import (
+    EmbeddingCache,
+    get_embedding_cache,
+)
 from umdalib.logger import logger
 import joblib
 from gensim.models import word2vec
@@ -48,6 +52,17 @@ def load_model():
     return load(pretrained_model_file)
 
 
+def embed_smiles(smiles: list[str], smi_to_vector, embedder_model) -> np.ndarray:
+    """Vectors of smiles, taken from the embedding cache where possible"""
+
+    def embed(smiles: pd.Series):
+        return np.array([smi_to_vector(smi, embedder_model) for smi in smiles])
+
+    if embedding_cache is None:
+        return embed(pd.Series(smiles))
+    return embedding_cache.embed(pd.Series(smiles), embed)
+
+
 def predict_from_file(
     prediction_file: pt,
     vectors_file: pt,
@@ -70,7 +85,7 @@ def predict_from_file(
     if len(smiles) == 0:
         raise ValueError("No valid SMILES found in test file")
 
-    X = np.array([smi_to_vector(smi, embedder_model) for smi in smiles])
+    X = embed_smiles(smiles, smi_to_vector, embedder_model)
     logger.info(f"{X.shape=}")
 
     if "_with" in vectors_file.stem:
@@ -107,10 +122,11 @@ def predict_from_file(
 
 
 pretrained_model_file = None
+embedding_cache: EmbeddingCache = None
 
 
 def main(args: Args):
-    global pretrained_model_file
+    global pretrained_model_file, embedding_cache
 
     pretrained_model_file = pt(args.pretrained_model_file)
     pretrained_model_loc = pretrained_model_file.parent
@@ -143,6 +159,7 @@ def main(args: Args):
         embedder_name=args.embedder_name, embedder_loc=args.embedder_loc
     )
     smi_to_vector = smi_to_vec_dict[args.embedder_name]
+    embedding_cache = get_embedding_cache(args.embedder_name, args.embedder_loc)
 
     logger.info(f"Loading estimator from {pretrained_model_file}")
     estimator, scaler = load_model()
@@ -166,7 +183,7 @@ def main(args: Args):
         )
 
     logger.info(f"Loading smi: {args.smiles}")
-    X = smi_to_vector(args.smiles, embedder_model)
+    X = embed_smiles([args.smiles], smi_to_vector, embedder_model)[0]
     logger.info(f"{X.shape=}")
 
     if "_with" in vectors_file.stem:
@@ -20,6 +20,14 @@ class Args:
     use_dask: bool
 
 
+# compute() memoizes the result until the analysis file changes
+CACHEABLE = True
+
+
+def get_cache_files(args: Args):
+    return [args.analysis_file["filename"]], []
+
+
 def linear_fit(x, m, c):
     return m * x + c
 
@@ -31,6 +39,7 @@ def main(args: Args):
         args.analysis_file["key"],
         use_dask=args.use_dask,
         computed=True,
+        columns=[args.columnX, args.columnY],
     )
 
     y_true = df[args.columnX].values
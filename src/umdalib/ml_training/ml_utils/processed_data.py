@@ -0,0 +1,119 @@
+import json
+import os
+from pathlib import Path as pt
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from umdalib.utils.fingerprint import file_fingerprint, file_hash
+
+# Processed training set of ml_model.get_data, stored in processed_<vectors>/:
+#   processed_X.npy         (n_samples, n_features) matrix of the valid rows
+#   processed_rows.parquet  index, SMILES and y of those rows
+#   manifest.json           fingerprints of the vectors and training files
+# When every row is valid and the vectors file is a numeric .npy, the matrix
+# is not copied and the manifest points to the vectors file instead.
+# The manifest is written last, a directory without one is never used.
+PROCESSED_DATA_VERSION = 1
+PROCESSED_X_FILE = "processed_X.npy"
+PROCESSED_ROWS_FILE = "processed_rows.parquet"
+MANIFEST_FILE = "manifest.json"
+# also removed with a stale manifest (processed_df.parquet is the old layout)
+DERIVED_FILES = ["processed_df.parquet", ".all_valid"]
+
+
+def file_state(filename: str) -> dict:
+    path = pt(filename).resolve()
+    stat = path.stat()
+    return {"path": str(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def get_sources(vectors_file: str, training_file: dict, columns: list) -> dict:
+    """What the processed data is derived from (without hashing the files)"""
+    return {
+        "version": PROCESSED_DATA_VERSION,
+        "vectors_file": file_state(vectors_file),
+        "training_file": file_state(training_file["filename"]),
+        "key": training_file.get("key"),
+        "columns": columns,
+    }
+
+
+def is_unchanged(stored: dict, current: dict) -> bool:
+    """Same file content, re-hashing only if it was touched"""
+    if stored is None:
+        return False
+    if stored["size"] != current["size"]:
+        return False
+    if stored["mtime_ns"] == current["mtime_ns"]:
+        return True
+    return file_hash(current["path"]) == stored["sha256"]
+
+
+def is_fresh(manifest: dict, sources: dict) -> bool:
+    return (
+        manifest.get("version") == sources["version"]
+        and manifest.get("key") == sources["key"]
+        and manifest.get("columns") == sources["columns"]
+        and is_unchanged(manifest.get("vectors_file"), sources["vectors_file"])
+        and is_unchanged(manifest.get("training_file"), sources["training_file"])
+    )
+
+
+def load_processed(
+    directory: pt, sources: dict
+) -> tuple[np.ndarray, pd.DataFrame] | None:
+    """Memory-mapped X and the rows frame, or None if missing or stale"""
+    manifest_file = directory / MANIFEST_FILE
+    if not manifest_file.exists():
+        clear_processed(directory)  # nothing here can be trusted
+        return None
+
+    manifest = json.loads(manifest_file.read_text())
+    if not is_fresh(manifest, sources):
+        logger.warning(f"Processed data in {directory} is stale, rebuilding it")
+        clear_processed(directory)
+        return None
+
+    X = np.load(directory / manifest["matrix"], mmap_mode="r")
+    rows = pd.read_parquet(directory / PROCESSED_ROWS_FILE)
+    return X, rows
+
+
+def save_processed(
+    directory: pt, sources: dict, X: np.ndarray, rows: pd.DataFrame, copy_X: bool
+):
+    """Store X (unless it is the vectors file itself) and rows, then the manifest"""
+    directory.mkdir(parents=True, exist_ok=True)
+    pid = os.getpid()
+
+    matrix = sources["vectors_file"]["path"]
+    if copy_X:
+        matrix = PROCESSED_X_FILE
+        tmp_file = directory / f".processed_X.{pid}.tmp.npy"
+        np.save(tmp_file, X)
+        os.replace(tmp_file, directory / PROCESSED_X_FILE)
+
+    tmp_file = directory / f".{PROCESSED_ROWS_FILE}.{pid}.tmp"
+    rows.to_parquet(tmp_file, compression="snappy")
+    os.replace(tmp_file, directory / PROCESSED_ROWS_FILE)
+
+    manifest = {
+        **sources,
+        "vectors_file": file_fingerprint(sources["vectors_file"]["path"]),
+        "training_file": file_fingerprint(sources["training_file"]["path"]),
+        "matrix": matrix,
+        "shape": list(X.shape),
+    }
+    (directory / MANIFEST_FILE).write_text(json.dumps(manifest, indent=4))
+    logger.success(f"Processed data saved to {directory}")
+
+
+def clear_processed(directory: pt):
+    """Remove the processed data and everything derived from it"""
+    files = [MANIFEST_FILE, PROCESSED_X_FILE, PROCESSED_ROWS_FILE, *DERIVED_FILES]
+    for name in files:
+        (directory / name).unlink(missing_ok=True)
+    for label_issues_file in directory.glob("label_issues_*.parquet"):
+        label_issues_file.unlink()
@@ -2,6 +2,7 @@ from rdkit import Chem
 from rdkit.Chem import Descriptors
 from dataclasses import dataclass
 from umdalib.logger import logger
+from umdalib.load_file.molecule_store import mol_from_smiles
 
 
 class MoleculeAnalyzer:
@@ -19,7 +20,7 @@ class MoleculeAnalyzer:
             smiles (str): The SMILES string of the molecule.
         """
         self.smiles = smiles
-        self.mol = Chem.MolFromSmiles(smiles)
+        self.mol = mol_from_smiles(smiles)  # a copy, kekulization modifies it
         self.results = {}  # Initialize an empty dictionary to store results
 
         if self.mol is None:
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from umdalib.logger import logger
+from umdalib.load_file.molecule_store import mol_from_smiles
 from rdkit import Chem
 from rdkit.Chem import AllChem
 
@@ -11,7 +12,7 @@ class Args:
 
 def smiles_to_pdb_string(smiles: str):
     try:
-        mol = Chem.MolFromSmiles(smiles)
+        mol = mol_from_smiles(smiles)  # a copy, embedding modifies it
         if mol is None:
             return None, "Invalid SMILES string"
         # mol = Chem.AddHs(mol)
@@ -6,17 +6,34 @@ import json  # noqa: E402
 import sys  # noqa: E402
 import traceback  # noqa: E402
 import uuid  # noqa: E402
+from itertools import chain  # noqa: E402
 
 import rq_dashboard  # noqa: E402
-from flask import Flask, jsonify, render_template, request  # noqa: E402
+from flask import (  # noqa: E402
+    Flask,
+    Response,
+    jsonify,
+    render_template,
+    request,
+    send_file,
+    stream_with_context,
+)
 from flask_cors import CORS  # noqa: E402
-from flask_socketio import SocketIO  # noqa: E402
+from flask_socketio import SocketIO, join_room, leave_room  # noqa: E402
 from redis import Redis  # noqa: E402
 from rq import Queue  # noqa: E402
 from rq.job import Job  # noqa: E402
 
 from umdalib.logger import Paths, logger  # noqa: E402
-from umdalib.utils.computation import compute  # noqa: E402
+from umdalib.utils.computation import compute, get_module_registry_stats  # noqa: E402
+from umdalib.utils.job_context import cancel_key  # noqa: E402
+from umdalib.utils.queues import get_queue_class  # noqa: E402
+from umdalib.utils.result_cache import clear_cache, get_cache_stats  # noqa: E402
+from umdalib.utils.result_store import (  # noqa: E402
+    is_result_handle,
+    iter_result_chunks,
+    result_path,
+)
 
 # flask app
 log_dir = Paths().app_log_dir
@@ -34,7 +51,14 @@ socketio = SocketIO(
 # Redis configuration
 app.config["REDIS_URL"] = "redis://localhost:6379/0"
 redis_conn = Redis.from_url(app.config["REDIS_URL"])
-queue = Queue(connection=redis_conn)
+queues: dict[str, Queue] = {}
+
+
+def get_queue(name: str) -> Queue:
+    if name not in queues:
+        queues[name] = Queue(name, connection=redis_conn)
+    return queues[name]
+
 
 # Configure and initialize RQ Dashboard
 app.config.from_object(rq_dashboard.default_settings)
@@ -45,11 +69,21 @@ app.register_blueprint(rq_dashboard.blueprint, url_prefix="/rq")
 # Track connected clients
 connected_clients = set()
 
+# Clients sit in ALL_JOBS_ROOM until they watch specific jobs, after which they
+# only receive events for those jobs (room "job:<job_id>")
+ALL_JOBS_ROOM = "all_jobs"
+watched_jobs: dict[str, set[str]] = {}
+
+
+def job_room(job_id: str) -> str:
+    return f"job:{job_id}"
+
 
 @socketio.on("connect")
 def handle_connect():
     client_id = request.sid
     connected_clients.add(client_id)
+    join_room(ALL_JOBS_ROOM)
     logger.info(f"Client connected: {client_id}")
     # Emit directly to the connected client
     socketio.emit(
@@ -64,18 +98,55 @@ def handle_disconnect():
     client_id = request.sid
     if client_id in connected_clients:
         connected_clients.remove(client_id)
+    watched_jobs.pop(client_id, None)
     logger.info(f"Client disconnected: {client_id}")
 
 
-def emit_to_all_clients(event_type, data):
-    """Helper function to emit to all connected clients"""
-    logger.info(f"Emitting {event_type} to {len(connected_clients)} clients")
-    for client_id in connected_clients:
-        try:
-            socketio.emit(event_type, data, room=client_id)
-            logger.info(f"Emitted {event_type} to client {client_id}")
-        except Exception as e:
-            logger.error(f"Error emitting to client {client_id}: {str(e)}")
+def requested_job_id(data) -> str | None:
+    """job_id of a watch/unwatch request, sent as {"job_id": ...} or as is"""
+    job_id = data.get("job_id") if isinstance(data, dict) else data
+    if not job_id:
+        logger.warning(f"Ignoring watch request without a job_id from {request.sid}")
+        return None
+    return job_id
+
+
+@socketio.on("watch_job")
+def handle_watch_job(data):
+    """Only receive events for the watched job(s) from now on"""
+    client_id = request.sid
+    job_id = requested_job_id(data)
+    if not job_id:
+        return
+    join_room(job_room(job_id))
+    leave_room(ALL_JOBS_ROOM)
+    watched_jobs.setdefault(client_id, set()).add(job_id)
+    logger.info(f"Client {client_id} watching {job_id}")
+
+
+@socketio.on("unwatch_job")
+def handle_unwatch_job(data):
+    """Stop watching a job; with nothing left to watch, receive all job events again"""
+    client_id = request.sid
+    job_id = requested_job_id(data)
+    if not job_id:
+        return
+    leave_room(job_room(job_id))
+    jobs = watched_jobs.get(client_id, set())
+    jobs.discard(job_id)
+    if not jobs:
+        watched_jobs.pop(client_id, None)
+        join_room(ALL_JOBS_ROOM)
+    logger.info(f"Client {client_id} stopped watching {job_id}")
+
+
+def emit_job_event(event_type, data):
+    """Emit a job event to clients watching that job and to unfiltered clients"""
+    rooms = [ALL_JOBS_ROOM]
+    job_id = data.get("job_id") if isinstance(data, dict) else None
+    if job_id:
+        rooms.append(job_room(job_id))
+    socketio.emit(event_type, data, to=rooms)
 
 
 def handle_worker_message(message):
@@ -85,9 +156,9 @@ def handle_worker_message(message):
             data = json.loads(message["data"])
             event_type = data.get("event")
             if event_type:
-                logger.info(f"Broadcasting event: {event_type}")
-                # Use the helper function to emit to all clients
-                emit_to_all_clients(event_type, data["payload"])
+                if event_type != "job_progress":
+                    logger.info(f"Broadcasting event: {event_type}")
+                emit_job_event(event_type, data["payload"])
     except Exception as e:
         logger.error(f"Error handling worker message: {str(e)}")
         logger.error(traceback.format_exc())
@@ -103,21 +174,24 @@ def publish_event(event_type, payload):
 
 
 def pubsub_listener():
-    """Listen for messages from workers"""
-    pubsub = redis_conn.pubsub()
-    pubsub.subscribe("job_channel")
-    logger.info("Pubsub listener started")
-
+    """
+    Listen for messages from workers.
+    listen() blocks on the (eventlet green) socket, so events are forwarded as
+    soon as they arrive and in the order they were published.
+    """
     while True:
+        pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
         try:
-            message = pubsub.get_message(timeout=1.0)
-            if message:
-                logger.info(f"Received message from Redis: {message}")
-                socketio.start_background_task(handle_worker_message, message)
-            eventlet.sleep(0.1)  # Use eventlet sleep
+            pubsub.subscribe("job_channel")
+            logger.info("Pubsub listener started")
+            for message in pubsub.listen():
+                logger.debug(f"Received message from Redis: {message}")
+                handle_worker_message(message)
         except Exception as e:
             logger.error(f"Error in pubsub listener: {str(e)}")
             eventlet.sleep(1)
+        finally:
+            pubsub.close()
 
 
 @app.route("/enqueue_job", methods=["POST"])
@@ -126,22 +200,34 @@ def enqueue_job():
         data = request.get_json()
         job_id = f"job_{uuid.uuid4().hex}"
 
+        # Route by explicit queue / resource class hint, else by pyfile
+        queue_class = get_queue_class(
+            data["pyfile"],
+            resource_class=data.get("resource_class"),
+            queue=data.get("queue"),
+        )
+        queue = get_queue(queue_class.queue)
+
         # Enqueue the job
         job = queue.enqueue(
             "umdalib.worker.long_computation",
             job_id,
             data["pyfile"],
             data["args"],
+            use_cache=data.get("use_cache", True),
             job_id=job_id,
-            job_timeout="24h",  # Timeout set here during enqueueing
-            result_ttl=500,
-            failure_ttl=48 * 60 * 60,
+            job_timeout=queue_class.job_timeout,  # Timeout set here during enqueueing
+            result_ttl=queue_class.result_ttl,
+            failure_ttl=queue_class.failure_ttl,
+            at_front=data.get("priority") == "high",
         )
+        logger.info(f"Enqueued {data['pyfile']} as {job.id} on {queue.name} queue")
 
-        # Emit job queued event to all clients
-        emit_to_all_clients("job_queued", {"job_id": job.id, "status": "queued"})
+        emit_job_event(
+            "job_queued", {"job_id": job.id, "status": "queued", "queue": queue.name}
+        )
 
-        return jsonify({"job_id": job.id}), 202
+        return jsonify({"job_id": job.id, "queue": queue.name}), 202
     except Exception as e:
         logger.error(f"Error enqueueing job: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -153,20 +239,51 @@ def get_job_status(job_id):
     return jsonify({"status": job.get_status()}), 200
 
 
+def stored_result_response(result_id: str):
+    """
+    Stream a stored result without loading it into memory. With ?raw=1 the
+    gzipped file is sent as is, which also supports HTTP range requests.
+    """
+    try:
+        path = result_path(result_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not path.exists():
+        return jsonify({"error": f"Result {result_id} is no longer available"}), 410
+
+    if request.args.get("raw"):
+        return send_file(path, mimetype="application/gzip", conditional=True)
+
+    body = chain(
+        [b'{"message": "Job completed", "result": '],
+        iter_result_chunks(result_id),
+        [b"}"],
+    )
+    return Response(stream_with_context(body), mimetype="application/json")
+
+
 @app.route("/job_result/<job_id>", methods=["GET"])
 def get_job_result(job_id):
     job = Job.fetch(job_id, connection=redis_conn)
     if job.is_finished:
+        if is_result_handle(job.result):
+            return stored_result_response(job.result["result_id"])
         return jsonify({"message": "Job completed", "result": job.result}), 200
     else:
         return jsonify({"message": "Job not completed yet"}), 202
 
 
+@app.route("/stored_result/<result_id>", methods=["GET"])
+def get_stored_result(result_id):
+    """Fetch a stored result by the result_id of its handle (outlives the RQ job)"""
+    return stored_result_response(result_id)
+
+
 @app.route("/cancel_job/<job_id>", methods=["POST"])
 def cancel_job(job_id):
     try:
         # Set a cancellation flag in Redis
-        redis_conn.set(f"job_cancelled_{job_id}", "1")
+        redis_conn.set(cancel_key(job_id), "1")
 
         # Cancel the RQ job
         job = Job.fetch(job_id, connection=redis_conn)
@@ -215,8 +332,22 @@ def home():
 def run_compute():
     try:
         data = request.get_json()
-        result = compute(data["pyfile"], data["args"])
+        result = compute(
+            data["pyfile"], data["args"], use_cache=data.get("use_cache", True)
+        )
         return jsonify(result), 200
     except Exception as e:
         logger.error(f"Error enqueueing job: {str(e)}")
         return jsonify({"error": str(e)}), 500
+
+
+@app.route("/module_registry", methods=["GET"])
+def module_registry():
+    return jsonify(get_module_registry_stats()), 200
+
+
+@app.route("/compute_cache", methods=["GET", "DELETE"])
+def compute_cache():
+    if request.method == "DELETE":
+        clear_cache()
+    return jsonify(get_cache_stats()), 200
@@ -1,13 +1,15 @@
 import multiprocessing
 import os
+import signal
 import subprocess
 import sys
 import time
 
 from redis import Redis
-from rq import Queue, Worker
+from rq import Queue, SimpleWorker, Worker
 
 from umdalib.logger import logger
+from umdalib.utils.queues import DEFAULT_WORKERS, pyfiles_for_queues, queues_by_priority
 
 # Check if the environment variable is set
 if os.getenv("OBJC_DISABLE_INITIALIZE_FORK_SAFETY") != "YES":
@@ -18,31 +20,80 @@ if os.getenv("OBJC_DISABLE_INITIALIZE_FORK_SAFETY") != "YES":
 
 
 def create_worker(
-    redis_url: str, listen: list[str] = ["default"], worker_name: str = "worker"
+    redis_url: str,
+    listen: list[str] = ["default"],
+    worker_name: str = "worker",
+    pool_options: dict = None,
 ):
     conn = Redis.from_url(redis_url)
     queues = [Queue(name, connection=conn) for name in listen]
-    worker = Worker(queues, connection=conn, name=worker_name)
-    logger.info(f"Starting Redis worker: {worker_name}")
+
+    worker_class = Worker
+    if pool_options and pool_options.get("enabled"):
+        # jobs run in this process and are dispatched to its warm process pool,
+        # so RQ does not need to fork a work horse per job
+        from umdalib.worker import configure_worker_pool
+
+        # only pay the import cost for modules routed to the queues we serve
+        preload = pool_options.get("preload") or pyfiles_for_queues(listen)
+        configure_worker_pool(**(pool_options | {"preload": preload}))
+        worker_class = SimpleWorker
+
+    worker = worker_class(queues, connection=conn, name=worker_name)
+    logger.info(f"Starting Redis worker: {worker_name} ({worker_class.__name__})")
     worker.work(with_scheduler=True)
 
 
 class Args:
     port: int = 6379
-    listen: list[str] = ["default"]
+    listen: list[str] = queues_by_priority()
+    # e.g. "embedding:2, training:1, light:4"; empty runs a single worker in-process
+    workers: str = DEFAULT_WORKERS
+    health_check_interval: int = 5
+    drain_timeout: int = 300
+    use_process_pool: bool = True
+    pool_size: int = 1
+    pool_max_jobs_per_child: int = 20
+    pool_max_memory_mb: int = 4096
+
+
+def get_pool_options(args: Args) -> dict:
+    return {
+        "enabled": getattr(args, "use_process_pool", Args.use_process_pool),
+        "size": getattr(args, "pool_size", Args.pool_size),
+        "max_jobs_per_child": getattr(
+            args, "pool_max_jobs_per_child", Args.pool_max_jobs_per_child
+        ),
+        "max_memory_mb": getattr(args, "pool_max_memory_mb", Args.pool_max_memory_mb),
+    }
 
 
 def main(args: Args):
-    listen = args.listen
+    listen = getattr(args, "listen", Args.listen)
     redis_url = f"redis://localhost:{args.port}"
+    workers = getattr(args, "workers", Args.workers)
+
+    if workers:
+        worker_counts = parse_worker_counts(workers)
+        logger.info(f"Connecting to Redis at {redis_url} with workers {worker_counts}")
+        run_worker_in_subprocess(
+            redis_url,
+            worker_counts,
+            pool_options=get_pool_options(args),
+            health_check_interval=float(
+                getattr(args, "health_check_interval", Args.health_check_interval)
+            ),
+            drain_timeout=float(getattr(args, "drain_timeout", Args.drain_timeout)),
+        )
+        return
+
     logger.info(f"Connecting to Redis at {redis_url} and listening to {listen}")
 
     # Run the worker in the main process
     logger.info("Starting Redis worker in main process")
     try:
         logger.info("Redis worker running")
-        create_worker(redis_url, listen)
-        # run_worker_in_subprocess(redis_url, listen)
+        create_worker(redis_url, listen, pool_options=get_pool_options(args))
     except KeyboardInterrupt:
         logger.warning("Redis worker interrupted. Shutting down...")
     except Exception as e:
@@ -52,48 +103,147 @@ def main(args: Args):
         sys.exit(0)
 
 
-def run_worker_in_subprocess(redis_url: str, listen: list[str]):
-    ncpus = multiprocessing.cpu_count()
-    num_workers = max(2, ncpus // 2)
-    num_workers = 1
-    processes: list[multiprocessing.Process] = []
+def parse_worker_counts(workers: str | dict[str, int]) -> dict[str, int]:
+    """
+    Parse a worker spec such as "embedding:2, training:1, light:4" into
+    {queue: count}. A key may list several queues in priority order,
+    e.g. "light+default:2" starts two workers listening to light, then default.
+    """
+    if isinstance(workers, dict):
+        return {queue: int(count) for queue, count in workers.items()}
+
+    worker_counts: dict[str, int] = {}
+    for item in workers.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        queue, _, count = item.partition(":")
+        count = int(count) if count.strip() else 1
+        if count < 0:
+            raise ValueError(f"Invalid worker count for {queue}: {count}")
+        worker_counts[queue.strip()] = count
+    return worker_counts
+
+
+class SupervisedWorker:
+    def __init__(self, redis_url: str, queues: str, index: int, pool_options: dict):
+        self.redis_url = redis_url
+        self.listen = queues.split("+")
+        self.name = f"{queues}-{index}"
+        self.pool_options = pool_options
+        self.process: multiprocessing.Process = None
+        self.restarts = 0
+        self.launches = 0
+        self.started_at = 0.0
+        self.next_start_at = 0.0
+
+    def start(self):
+        # RQ worker names must be unique, including stale registrations of crashed workers
+        self.launches += 1
+        worker_name = f"{self.name}-{os.getpid()}-{self.launches}"
+        self.process = multiprocessing.Process(
+            target=create_worker,
+            args=(self.redis_url, self.listen, worker_name, self.pool_options),
+            name=self.name,
+        )
+        self.process.start()
+        self.started_at = time.monotonic()
+        logger.info(f"Started worker {self.name} (pid {self.process.pid})")
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+def run_worker_in_subprocess(
+    redis_url: str,
+    worker_counts: dict[str, int],
+    pool_options: dict = None,
+    health_check_interval: float = 5,
+    drain_timeout: float = 300,
+):
+    """
+    Supervise one RQ worker process per slot in worker_counts, restarting
+    crashed workers with exponential backoff. On SIGTERM/SIGINT the workers are
+    asked for a warm shutdown (finish the current job) and killed only if they
+    are still running after drain_timeout seconds.
+    """
+
+    workers = [
+        SupervisedWorker(redis_url, queues, i, pool_options)
+        for queues, count in worker_counts.items()
+        for i in range(count)
+    ]
+    if not workers:
+        raise ValueError(f"No workers requested: {worker_counts}")
+
+    stopping = False
+
+    def request_stop(signum, _frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        logger.warning(f"Received signal {signum}, draining workers...")
+        # Ctrl+C already reaches every process in the group; a second signal
+        # would turn RQ's warm shutdown into a cold one
+        if signum != signal.SIGINT:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.process.terminate()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    conn = Redis.from_url(redis_url)
 
     try:
-        for i in range(num_workers):
-            process = multiprocessing.Process(
-                target=create_worker, args=(redis_url, listen), name=f"Worker-{i}"
-            )
-            process.start()
-            processes.append(process)
-            logger.info(f"Started worker {i+1}")
+        for worker in workers:
+            worker.start()
+        logger.info(f"Redis supervisor running {len(workers)} workers: {worker_counts}")
 
-        logger.info("Redis worker running")
         # Monitor and restart workers if they die
-        while True:
-            for i, process in enumerate(processes):
-                if not process.is_alive():
-                    logger.warning(f"Worker {i} died, restarting...")
-                    processes[i] = multiprocessing.Process(
-                        target=create_worker,
-                        args=(redis_url, listen),
-                        name=f"Worker-{i}",
+        while not stopping:
+            for worker in workers:
+                if worker.is_alive() or stopping:
+                    continue
+
+                now = time.monotonic()
+                if worker.process is not None:
+                    logger.warning(
+                        f"Worker {worker.name} exited with code {worker.process.exitcode}"
                     )
-                    processes[i].start()
-                break
-
-            time.sleep(5)  # Check every 5 seconds
-
-    except KeyboardInterrupt:
-        logger.warning("Shutting down workers...")
-        for process in processes:
-            process.terminate()
-            process.join(timeout=1)
+                    # back off if the worker keeps crashing right after start
+                    if now - worker.started_at < 60:
+                        delay = min(2**worker.restarts, 60)
+                    else:
+                        worker.restarts = 0
+                        delay = 0
+                    worker.process = None
+                    worker.restarts += 1
+                    worker.next_start_at = now + delay
+                    logger.info(f"Restarting worker {worker.name} in {delay} s")
+
+                if now >= worker.next_start_at:
+                    worker.start()
+
+            try:
+                conn.ping()
+            except Exception as e:
+                logger.error(f"Redis health check failed: {e}")
+
+            time.sleep(health_check_interval)
 
     finally:
-        for process in processes:
-            if process.is_alive():
-                process.terminate()
-                process.join(timeout=1)
+        logger.warning("Shutting down workers...")
+        deadline = time.monotonic() + drain_timeout
+        for worker in workers:
+            if worker.process is None:
+                continue
+            worker.process.join(timeout=max(deadline - time.monotonic(), 0))
+            if worker.process.is_alive():
+                logger.warning(f"Worker {worker.name} did not drain in time, killing")
+                worker.process.kill()
+                worker.process.join()
         logger.info("All workers shut down.")
         logger.info("Redis worker stopped")
         sys.exit(0)
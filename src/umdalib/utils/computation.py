@@ -1,15 +1,78 @@
 import json
+import os
 import traceback
 import warnings
 from importlib import import_module, reload
 from pathlib import Path as pt
 from time import perf_counter
+from types import ModuleType
 
 import joblib
 from gensim.models import word2vec
 
 from umdalib.logger import Paths, logger
-from umdalib.utils.json import convert_to_json_compatible, safe_json_dump
+from umdalib.utils.job_context import JobCancelled
+from umdalib.utils.json import (
+    convert_to_json_compatible,
+    preview_json,
+    safe_json_dump,
+)
+from umdalib.utils.result_cache import (
+    cache_key,
+    get_cache_files,
+    get_cached_result,
+    is_cacheable,
+    store_cached_result,
+)
+
+# Modules are imported once and kept resident for the lifetime of the process.
+# Set UMDAPY_DEV_RELOAD=1 (or pass dev_reload=True to compute) to re-import the
+# module on every call while editing the source.
+DEV_RELOAD = os.getenv("UMDAPY_DEV_RELOAD", "0").lower() in ("1", "true", "yes")
+
+module_registry: dict[str, ModuleType] = {}
+module_registry_stats: dict[str, dict[str, float | int]] = {}
+
+
+def get_module(pyfile: str, dev_reload: bool = False) -> ModuleType:
+    """Return the resident ``umdalib.{pyfile}`` module, importing it on first use."""
+
+    stats = module_registry_stats.setdefault(
+        pyfile, {"imports": 0, "hits": 0, "import_time": 0.0, "time_saved": 0.0}
+    )
+
+    start_time = perf_counter()
+    module = module_registry.get(pyfile)
+
+    if module is not None and not dev_reload:
+        stats["hits"] += 1
+        stats["time_saved"] += max(
+            stats["import_time"] - (perf_counter() - start_time), 0
+        )
+        logger.info(
+            f"Using resident module umdalib.{pyfile} (saved ~{stats['import_time']:.2f} s)"
+        )
+        return module
+
+    if module is None:
+        module = import_module(f"umdalib.{pyfile}")
+    else:
+        logger.warning(f"Dev reload enabled: reloading umdalib.{pyfile}")
+        module = reload(module)
+
+    module_registry[pyfile] = module
+    stats["imports"] += 1
+    stats["import_time"] = perf_counter() - start_time
+    logger.info(f"Imported umdalib.{pyfile} in {stats['import_time']:.2f} s")
+
+    return module
+
+
+def get_module_registry_stats() -> dict[str, dict[str, float | int]]:
+    return {
+        pyfile: stats | {"resident": pyfile in module_registry}
+        for pyfile, stats in module_registry_stats.items()
+    }
 
 
 def load_model(filepath: str, use_joblib: bool = False):
@@ -31,10 +94,15 @@ class MyClass(object):
             setattr(self, key, value)
 
 
-def compute(pyfile: str, args: dict | str):
+def compute(
+    pyfile: str, args: dict | str, dev_reload: bool = None, use_cache: bool = True
+):
     try:
         logger.info(f"{pyfile=}")
 
+        if dev_reload is None:
+            dev_reload = DEV_RELOAD
+
         log_dir = Paths().app_log_dir
         args_file = log_dir / f"{pyfile}.args.json"
         if isinstance(args, str):
@@ -45,6 +113,7 @@ def compute(pyfile: str, args: dict | str):
         safe_json_dump(args, args_file)
         logger.info(f"\n[Received arguments]\n{json.dumps(args, indent=4)}")
 
+        args_dict = args
         args = MyClass(**args)
 
         result_file = log_dir / f"{pyfile}.json"
@@ -53,8 +122,19 @@ def compute(pyfile: str, args: dict | str):
         #     result_file.unlink()
 
         with warnings.catch_warnings(record=True) as warnings_list:
-            pyfunction = import_module(f"umdalib.{pyfile}")
-            pyfunction = reload(pyfunction)
+            pyfunction = get_module(pyfile, dev_reload=dev_reload)
+
+            key, cache_files = None, None
+            if use_cache and not dev_reload and is_cacheable(pyfunction):
+                cache_files = get_cache_files(pyfunction, args)
+                if cache_files is not None:
+                    key = cache_key(pyfile, args_dict, cache_files[0])
+
+            cached_result = get_cached_result(key, pyfile) if key else None
+            if cached_result is not None:
+                cached_result["cached"] = True
+                safe_json_dump(cached_result, result_file)
+                return cached_result
 
             start_time = perf_counter()
             result: dict = {}
@@ -76,11 +156,17 @@ def compute(pyfile: str, args: dict | str):
 
             result = convert_to_json_compatible(result)
             logger.success(f"Computation completed successfully in {computed_time}")
-            logger.success(f"result = {json.dumps(result, indent=4)}")
+            logger.success(f"result = {preview_json(result)}")
             safe_json_dump(result, result_file)
 
+            if key:
+                store_cached_result(key, pyfile, result, cache_files[1])
+
         logger.info(f"Finished main.py execution for {pyfile} in {computed_time}")
         return result
+    except JobCancelled as e:
+        logger.warning(f"{pyfile} stopped: {e}")
+        raise
     except Exception:
         error = traceback.format_exc(5)
         logger.error(error)
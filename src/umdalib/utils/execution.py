@@ -0,0 +1,116 @@
+import os
+from contextlib import contextmanager
+from math import ceil
+from multiprocessing import cpu_count
+from pathlib import Path as pt
+
+import dask
+from dask.utils import parse_bytes
+
+from umdalib.logger import logger
+from umdalib.utils import RAM_IN_GB
+
+# Execution settings for every use_dask=True path. Partitions are sized by
+# bytes (UMDAPY_DASK_PARTITION_SIZE) and the scheduler follows the workload:
+# pandas/IO work and torch inference release the GIL and run on threads, while
+# mol2vec (RDKit parsing, python per molecule) needs processes (or a local
+# distributed cluster, which also enforces a memory limit per worker); its
+# model is loaded once per worker from the model file, not sent with the tasks.
+PARTITION_SIZE = os.getenv("UMDAPY_DASK_PARTITION_SIZE", "64MB")
+NUM_WORKERS = int(os.getenv("UMDAPY_DASK_WORKERS", 0)) or cpu_count()
+MEMORY_FRACTION = 0.8  # of the total RAM, shared by the workers
+MEMORY_LIMIT = os.getenv(
+    "UMDAPY_DASK_MEMORY_LIMIT",
+    f"{RAM_IN_GB * MEMORY_FRACTION / NUM_WORKERS:.2f}GB",
+)
+# force one scheduler for every workload (threads, processes, distributed)
+SCHEDULER_OVERRIDE = os.getenv("UMDAPY_DASK_SCHEDULER", "")
+
+WORKLOAD_SCHEDULERS = {
+    "io": "threads",
+    "pandas": "threads",
+    "torch": "threads",
+    "gensim": "processes",
+}
+
+# embedders are torch models except mol2vec (RDKit parsing, gensim lookups)
+EMBEDDING_WORKLOADS = {"mol2vec": "gensim"}
+
+# compute bound workloads get at least this many partitions per worker so
+# that slow rows do not leave workers idle
+COMPUTE_WORKLOADS = ("torch", "gensim")
+PARTITIONS_PER_WORKER = 2
+
+
+def partition_bytes() -> int:
+    return parse_bytes(PARTITION_SIZE)
+
+
+def partition_count(filename: str | pt = None, workload: str = "io") -> int:
+    """Number of partitions for the data in filename (estimated from its size)"""
+    npartitions = 1
+    if filename and pt(filename).exists():
+        npartitions = ceil(pt(filename).stat().st_size / partition_bytes())
+    if workload in COMPUTE_WORKLOADS:
+        npartitions = max(npartitions, NUM_WORKERS * PARTITIONS_PER_WORKER)
+    return max(npartitions, 1)
+
+
+def embedding_workload(embedding: str) -> str:
+    return EMBEDDING_WORKLOADS.get(embedding, "torch")
+
+
+def repartition(ddf, filename: str | pt = None, workload: str = "io"):
+    """Repartition ddf for workload, the partition count is never a fixed number"""
+    npartitions = partition_count(filename, workload)
+    if npartitions == ddf.npartitions:
+        return ddf
+    logger.info(f"Repartitioning {ddf.npartitions} -> {npartitions} for {workload}")
+    return ddf.repartition(npartitions=npartitions)
+
+
+def get_scheduler(workload: str = "io") -> str:
+    return SCHEDULER_OVERRIDE or WORKLOAD_SCHEDULERS.get(workload, "threads")
+
+
+@contextmanager
+def dask_scheduler(workload: str = "io"):
+    """Run the dask computations inside the block on the scheduler for workload"""
+    scheduler = get_scheduler(workload)
+
+    if scheduler == "distributed":
+        try:
+            from dask.distributed import Client, LocalCluster
+        except ImportError:
+            logger.warning("dask.distributed is not installed, using processes")
+            scheduler = "processes"
+        else:
+            logger.info(
+                f"Starting local cluster: {NUM_WORKERS} workers, {MEMORY_LIMIT} each"
+            )
+            with (
+                LocalCluster(
+                    n_workers=NUM_WORKERS,
+                    threads_per_worker=1,
+                    memory_limit=MEMORY_LIMIT,
+                    processes=True,
+                ) as cluster,
+                Client(cluster),
+            ):
+                yield scheduler
+            return
+
+    logger.info(f"Using dask {scheduler} scheduler ({NUM_WORKERS} workers)")
+    with dask.config.set(scheduler=scheduler, num_workers=NUM_WORKERS):
+        yield scheduler
+
+
+def execution_config() -> dict:
+    return {
+        "partition_size": PARTITION_SIZE,
+        "num_workers": NUM_WORKERS,
+        "memory_limit": MEMORY_LIMIT,
+        "schedulers": {
+            workload: get_scheduler(workload) for workload in WORKLOAD_SCHEDULERS
+        },
+    }
@@ -0,0 +1,37 @@
+from hashlib import sha256
+from pathlib import Path as pt
+
+# resolved path -> (size, mtime_ns, sha256); a file is only re-hashed when its
+# size or mtime changes
+fingerprint_memo: dict[str, tuple[int, int, str]] = {}
+
+
+def file_hash(filename: str | pt, chunk_size: int = 1024 * 1024) -> str:
+    digest = sha256()
+    with open(filename, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(filename: str | pt) -> dict | None:
+    """Path, size, mtime and content hash of a file (None if it does not exist)"""
+    path = pt(filename).resolve()
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+
+    memo = fingerprint_memo.get(str(path))
+    if memo and memo[:2] == (stat.st_size, stat.st_mtime_ns):
+        digest = memo[2]
+    else:
+        digest = file_hash(path)
+        fingerprint_memo[str(path)] = (stat.st_size, stat.st_mtime_ns, digest)
+
+    return {
+        "path": str(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": digest,
+    }
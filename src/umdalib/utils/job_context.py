@@ -0,0 +1,249 @@
+import json
+import os
+from hashlib import sha256
+from time import monotonic
+
+import joblib
+from dask.callbacks import Callback
+from redis import Redis
+
+from umdalib.logger import Paths, logger
+
+REDIS_URL = "redis://localhost:6379/0"
+CANCEL_CHECK_INTERVAL = 0.5  # seconds between Redis polls in is_cancelled
+CHECKPOINT_INTERVAL = 60  # seconds between periodic checkpoints of long loops
+CHECKPOINT_DIR = Paths().app_log_dir / "checkpoints"
+
+# Set by umdalib.worker around each job so job modules can report back to the UI
+current_job_id: str = None
+redis_conn: Redis = None
+
+cancel_requested = False
+last_cancel_check = 0.0
+
+
+class JobCancelled(Exception):
+    """Raised by a job that stopped cooperatively after being cancelled"""
+
+
+def cancel_key(job_id: str) -> str:
+    return f"job_cancelled_{job_id}"
+
+
+def cooperative_key(job_id: str) -> str:
+    """Set once a job polls for cancellation, so the worker waits instead of killing it"""
+    return f"job_cooperative_{job_id}"
+
+
+def get_redis() -> Redis:
+    global redis_conn
+
+    if redis_conn is None:
+        redis_conn = Redis.from_url(REDIS_URL)
+    return redis_conn
+
+
+def set_current_job(job_id: str | None):
+    global current_job_id, cancel_requested, last_cancel_check
+    current_job_id = job_id
+    cancel_requested = False
+    last_cancel_check = 0.0
+
+
+def get_current_job_id() -> str | None:
+    return current_job_id
+
+
+def is_cancelled() -> bool:
+    """
+    True once the current job has been cancelled (always False outside a job).
+    Cheap enough to call per batch or per trial: Redis is polled at most every
+    CANCEL_CHECK_INTERVAL seconds.
+    """
+    global cancel_requested, last_cancel_check
+
+    if current_job_id is None or cancel_requested:
+        return cancel_requested
+
+    now = monotonic()
+    if now - last_cancel_check < CANCEL_CHECK_INTERVAL:
+        return False
+
+    try:
+        conn = get_redis()
+        if last_cancel_check == 0.0:
+            conn.set(cooperative_key(current_job_id), "1", ex=24 * 60 * 60)
+        cancel_requested = bool(conn.get(cancel_key(current_job_id)))
+    except Exception as e:
+        logger.error(f"Error checking cancellation: {str(e)}")
+    last_cancel_check = now
+
+    return cancel_requested
+
+
+def raise_if_cancelled(message: str = None):
+    if is_cancelled():
+        raise JobCancelled(message or f"Job {current_job_id} was cancelled")
+
+
+def checkpoint_key(*parts) -> str:
+    """Stable key for a unit of work, e.g. checkpoint_key(pyfile, vars(args))"""
+    data = json.dumps(parts, sort_keys=True, default=str)
+    return sha256(data.encode("utf-8")).hexdigest()[:32]
+
+
+def checkpoint_path(key: str):
+    return CHECKPOINT_DIR / f"{key}.joblib"
+
+
+def save_checkpoint(key: str, state):
+    CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+    path = checkpoint_path(key)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    joblib.dump(state, tmp_path)
+    os.replace(tmp_path, path)
+    logger.info(f"Saved checkpoint {path.name}")
+
+
+def load_checkpoint(key: str, default=None):
+    path = checkpoint_path(key)
+    if not path.exists():
+        return default
+    try:
+        state = joblib.load(path)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable checkpoint {path.name}: {e}")
+        return default
+    logger.info(f"Loaded checkpoint {path.name}")
+    return state
+
+
+def clear_checkpoint(key: str):
+    checkpoint_path(key).unlink(missing_ok=True)
+
+
+def publish_job_event(event_type: str, payload: dict):
+    """Publish an event for the current job on the job_channel (no-op outside a job)"""
+    if current_job_id is None:
+        return
+
+    try:
+        message = {"event": event_type, "payload": {"job_id": current_job_id} | payload}
+        get_redis().publish("job_channel", json.dumps(message))
+    except Exception as e:
+        logger.error(f"Error publishing event: {str(e)}")
+
+
+class ProgressReporter:
+    """
+    Progress of a long-running step, published as "job_progress" events.
+
+    Updates are coalesced: at most one event per min_interval seconds and only
+    when the fraction moved by at least min_delta, so reporting from a tight
+    loop does not flood Redis or Socket.IO. The final state is always sent.
+    """
+
+    def __init__(
+        self,
+        total: int = None,
+        desc: str = "",
+        min_interval: float = 0.5,
+        min_delta: float = 0.01,
+    ):
+        self.total = total
+        self.desc = desc
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self.done = 0
+        self.message: str = None
+        self.start_time = monotonic()
+        self.last_emit_time = 0.0
+        self.last_emit_fraction = -1.0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def fraction(self) -> float | None:
+        if not self.total:
+            return None
+        return min(self.done / self.total, 1.0)
+
+    def update(self, n: int = 1, message: str = None):
+        self.set(self.done + n, message=message)
+
+    def set(self, done: int, total: int = None, message: str = None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        self.emit()
+
+    def close(self):
+        if not self.closed:
+            self.emit(force=True)
+            self.closed = True
+
+    def state(self) -> dict:
+        elapsed = monotonic() - self.start_time
+        throughput = self.done / elapsed if elapsed > 0 else None
+        eta = None
+        if throughput and self.total:
+            eta = max(self.total - self.done, 0) / throughput
+
+        return {
+            "desc": self.desc,
+            "done": self.done,
+            "total": self.total,
+            "fraction": self.fraction,
+            "elapsed": round(elapsed, 2),
+            "eta": round(eta, 2) if eta is not None else None,
+            "throughput": round(throughput, 2) if throughput else None,
+            "message": self.message,
+        }
+
+    def emit(self, force: bool = False):
+        now = monotonic()
+        fraction = self.fraction or 0.0
+        if not force:
+            if now - self.last_emit_time < self.min_interval:
+                return
+            if self.total and fraction - self.last_emit_fraction < self.min_delta:
+                return
+
+        self.last_emit_time = now
+        self.last_emit_fraction = fraction
+
+        state = self.state()
+        eta = f", ETA {state['eta']:.0f} s" if state["eta"] is not None else ""
+        logger.info(f"{self.desc}: {self.done}/{self.total or '?'}{eta}")
+        publish_job_event("job_progress", state)
+
+
+def track_progress(total: int = None, desc: str = "", **kwargs) -> ProgressReporter:
+    return ProgressReporter(total, desc, **kwargs)
+
+
+class DaskProgress(Callback):
+    """Report dask task completion through a ProgressReporter (replaces ProgressBar)"""
+
+    def __init__(self, desc: str = "Computing"):
+        super().__init__()
+        self.desc = desc
+        self.reporter: ProgressReporter = None
+
+    def _start_state(self, dsk, state):
+        total = sum(len(state[k]) for k in ["ready", "waiting", "running", "finished"])
+        self.reporter = ProgressReporter(total, self.desc)
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        self.reporter.set(len(state["finished"]))
+
+    def _finish(self, dsk, state, errored):
+        if self.reporter is not None:
+            self.reporter.close()
@@ -1,17 +1,32 @@
 from umdalib.logger import logger
 import json
+import os
 import pathlib
 import datetime
 import decimal
 import numpy as np
+import pandas as pd
 import types
 from pathlib import Path as pt
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PRIMITIVE_TYPES = (int, float, str, bool, type(None))
+
+# Payloads with more than this many scalars are written without indentation
+LARGE_PAYLOAD_ITEMS = 10_000
+
 
 def convert_to_json_compatible(obj):
     if isinstance(obj, dict):
         return {key: convert_to_json_compatible(value) for key, value in obj.items()}
     elif isinstance(obj, list):
+        # fast path for the common list of plain numbers/strings
+        if all(type(item) in PRIMITIVE_TYPES for item in obj):
+            return obj
         return [convert_to_json_compatible(item) for item in obj]
     elif isinstance(obj, tuple):
         return tuple(convert_to_json_compatible(item) for item in obj)
@@ -22,14 +37,20 @@ def convert_to_json_compatible(obj):
     elif isinstance(obj, decimal.Decimal):
         return float(obj)
     elif isinstance(obj, np.ndarray):
-        return obj.tolist()
+        if obj.dtype.kind in "biuf":
+            return obj.tolist()  # converted in C, no per-element calls
+        return convert_to_json_compatible(obj.tolist())
     elif isinstance(obj, np.generic):
         return obj.item()
+    elif isinstance(obj, pd.DataFrame):
+        return convert_to_json_compatible(obj.to_dict(orient="records"))
+    elif isinstance(obj, (pd.Series, pd.Index)):
+        return convert_to_json_compatible(obj.to_numpy())
     elif isinstance(obj, pathlib.Path):
         return str(obj)
     elif isinstance(obj, types.FunctionType):
         return f"<function {obj.__name__}>"
-    elif isinstance(obj, (int, float, str, bool, type(None))):
+    elif isinstance(obj, PRIMITIVE_TYPES):
         return obj
     else:
         if hasattr(obj, "__dict__"):
@@ -42,9 +63,88 @@ def convert_to_json_compatible(obj):
             return str(obj)
 
 
+def json_default(obj):
+    """Serializer hook for objects json/orjson do not handle natively"""
+    converted = convert_to_json_compatible(obj)
+    if converted is obj:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return converted
+
+
+def count_items(obj, limit: int = LARGE_PAYLOAD_ITEMS) -> int:
+    """Number of scalars in obj, counting stops once limit is passed"""
+    if isinstance(obj, np.ndarray):
+        return obj.size
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return obj.size
+    if isinstance(obj, dict):
+        obj = obj.values()
+    elif not isinstance(obj, (list, tuple, set)):
+        return 1
+
+    total = 0
+    for item in obj:
+        total += count_items(item, limit - total)
+        if total > limit:
+            break
+    return total
+
+
+def is_large_payload(obj) -> bool:
+    return count_items(obj) > LARGE_PAYLOAD_ITEMS
+
+
+def dumps_json(obj, indent: int = None) -> bytes:
+    """Serialize to UTF-8 JSON, using orjson when it is installed"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=json_default, option=option)
+
+    separators = None if indent else (",", ":")
+    text = json.dumps(obj, indent=indent, separators=separators, default=json_default)
+    return text.encode("utf-8")
+
+
+def preview_json(
+    obj, max_items: int = 5, max_keys: int = 20, max_chars: int = 2000
+) -> str:
+    """Short, indented view of a (possibly huge) result for the logs"""
+
+    def shorten(value):
+        if isinstance(value, dict):
+            items = list(value.items())
+            preview = {key: shorten(item) for key, item in items[:max_keys]}
+            if len(items) > max_keys:
+                preview["..."] = f"{len(items) - max_keys} more keys"
+            return preview
+        if isinstance(value, (list, tuple, np.ndarray)):
+            if len(value) > max_items:
+                return [shorten(item) for item in value[:max_items]] + [
+                    f"... ({len(value)} items)"
+                ]
+            return [shorten(item) for item in value]
+        return value
+
+    text = dumps_json(shorten(obj), indent=4).decode("utf-8")
+    if len(text) > max_chars:
+        text = text[:max_chars] + "\n... (truncated)"
+    return text
+
+
 def safe_json_dump(
-    obj: dict, filename: str | pt, overwrite=True, create_dir: bool = True
+    obj: dict,
+    filename: str | pt,
+    overwrite=True,
+    create_dir: bool = True,
+    indent: int | None = 4,
 ):
+    """
+    Write obj as JSON through a temporary file that atomically replaces filename,
+    so readers never see a partially written file. Large payloads are written
+    without indentation.
+    """
     if not isinstance(obj, dict):
         raise ValueError(f"Expected a dictionary, got {type(obj)}")
 
@@ -57,23 +157,33 @@ def safe_json_dump(
     if filename.suffix != ".json":
         filename = filename.with_suffix(".json")
 
-    if filename.exists():
-        if overwrite:
-            filename.unlink()
-            logger.warning(f"Deleted existing file: {filename} to overwrite")
-        else:
-            logger.error(f"File already exists: {filename}")
-            raise FileExistsError(f"File already exists: {filename}")
+    if filename.exists() and not overwrite:
+        logger.error(f"File already exists: {filename}")
+        raise FileExistsError(f"File already exists: {filename}")
 
     if not filename.parent.exists() and create_dir:
         logger.warning(f"Creating directory: {filename.parent}")
         filename.parent.mkdir(parents=True)
 
+    if indent and is_large_payload(obj):
+        indent = None
+
+    tmp_filename = filename.with_name(f".{filename.name}.{os.getpid()}.tmp")
     try:
         logger.info(f"Saving to {filename}")
-        with open(filename, "w") as f:
-            json.dump(convert_to_json_compatible(obj), f, indent=4)
-            logger.success(f"{filename.name} saved successfully to {filename.parent}")
+        if orjson is not None:
+            with open(tmp_filename, "wb") as f:
+                f.write(dumps_json(obj, indent=indent))
+        else:
+            # json.dump encodes and writes chunk by chunk
+            separators = None if indent else (",", ":")
+            with open(tmp_filename, "w") as f:
+                json.dump(
+                    obj, f, indent=indent, separators=separators, default=json_default
+                )
+        os.replace(tmp_filename, filename)
+        logger.success(f"{filename.name} saved successfully to {filename.parent}")
     except Exception as e:
+        tmp_filename.unlink(missing_ok=True)
         logger.error(f"Error saving to {filename}: {e}")
         raise e
@@ -0,0 +1,81 @@
+from dataclasses import dataclass
+from typing import Literal
+
+ResourceClass = Literal["interactive", "memory-heavy", "cpu-heavy", "default"]
+
+
+@dataclass(frozen=True)
+class QueueClass:
+    queue: str
+    priority: int  # lower is served first by a worker listening to several queues
+    job_timeout: str
+    result_ttl: int = 500
+    failure_ttl: int = 48 * 60 * 60
+
+
+RESOURCE_CLASSES: dict[ResourceClass, QueueClass] = {
+    "interactive": QueueClass("light", 0, "1h"),
+    "memory-heavy": QueueClass("embedding", 1, "24h"),
+    "cpu-heavy": QueueClass("training", 2, "24h"),
+    "default": QueueClass("default", 3, "24h"),
+}
+
+# pyfile -> resource class; anything not listed goes to "default"
+PYFILE_RESOURCE_CLASS: dict[str, ResourceClass] = {
+    "getVersion": "interactive",
+    "load_file.read_data": "interactive",
+    "load_file.check_duplicates_on_x_column": "interactive",
+    "load_file.make_index_and_save_file": "interactive",
+    "load_file.apply_filter_for_ydata": "interactive",
+    "load_file.apply_filter_for_molecular_analysis": "interactive",
+    "load_file.y_data_distribution": "interactive",
+    "molecule_analysis.generate_analysis": "interactive",
+    "molecule_analysis.optimize_3d_structure": "interactive",
+    "ml_training.ml_prediction_analysis": "interactive",
+    "ml_training.export_all_metrics": "interactive",
+    "load_file.molecular_analysis": "memory-heavy",
+    # embeds the SMILES (or a whole file of them) before predicting
+    "ml_training.ml_prediction": "memory-heavy",
+    "vectorize_molecules.embedder": "memory-heavy",
+    "ml_training.embedd_data": "memory-heavy",
+    "dimensionality_reduction.generate_reduced_embeddings": "memory-heavy",
+    "ml_training.ml_model": "cpu-heavy",
+}
+
+# one dedicated worker for interactive jobs so they never wait behind training
+DEFAULT_WORKERS = "light:1, embedding+training+default:1"
+
+
+def get_queue_class(
+    pyfile: str, resource_class: str = None, queue: str = None
+) -> QueueClass:
+    """
+    Route a job by an explicit queue name, else an explicit resource class hint,
+    else the pyfile itself.
+    """
+    if queue:
+        for queue_class in RESOURCE_CLASSES.values():
+            if queue_class.queue == queue:
+                return queue_class
+        raise ValueError(f"Unknown queue: {queue}")
+
+    if resource_class:
+        if resource_class not in RESOURCE_CLASSES:
+            raise ValueError(f"Unknown resource class: {resource_class}")
+        return RESOURCE_CLASSES[resource_class]
+
+    return RESOURCE_CLASSES[PYFILE_RESOURCE_CLASS.get(pyfile, "default")]
+
+
+def queues_by_priority() -> list[str]:
+    queue_classes = sorted(RESOURCE_CLASSES.values(), key=lambda q: q.priority)
+    return [queue_class.queue for queue_class in queue_classes]
+
+
+def pyfiles_for_queues(queues: list[str]) -> list[str]:
+    """pyfiles routed to any of the given queues (used to pick what a worker preloads)"""
+    return [
+        pyfile
+        for pyfile, resource_class in PYFILE_RESOURCE_CLASS.items()
+        if RESOURCE_CLASSES[resource_class].queue in queues
+    ]
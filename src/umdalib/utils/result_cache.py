@@ -0,0 +1,171 @@
+import gzip
+import json
+import os
+from hashlib import sha256
+from pathlib import Path as pt
+from time import time
+from types import ModuleType
+
+from umdalib.logger import Paths, logger
+from umdalib.utils.fingerprint import file_fingerprint
+from umdalib.utils.job_context import get_redis
+from umdalib.utils.json import dumps_json
+
+# Memoization of compute(pyfile, args) for modules that set CACHEABLE = True.
+# A module can also define get_cache_files(args) -> (input_files, output_files):
+# the contents of the inputs are part of the cache key, and a hit is only used
+# while the outputs it wrote are unchanged. Returning None skips the cache.
+RESULT_CACHE_ENABLED = os.getenv("UMDAPY_RESULT_CACHE", "1").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+RESULT_CACHE_DIR = Paths().app_log_dir / "compute_cache"
+RESULT_CACHE_MAX_BYTES = int(os.getenv("UMDAPY_RESULT_CACHE_MAX_MB", 512)) * 1024**2
+RESULT_CACHE_MAX_ENTRIES = 2000
+
+# shared by the server and all workers through Redis (best effort)
+STATS_KEY = "umdapy_compute_cache_stats"
+local_stats: dict[str, int] = {}
+
+
+def count(event: str, pyfile: str):
+    for field in (event, f"{pyfile}:{event}"):
+        local_stats[field] = local_stats.get(field, 0) + 1
+    try:
+        redis_conn = get_redis()
+        redis_conn.hincrby(STATS_KEY, event)
+        redis_conn.hincrby(STATS_KEY, f"{pyfile}:{event}")
+    except Exception:
+        pass
+
+
+def is_cacheable(module: ModuleType) -> bool:
+    return RESULT_CACHE_ENABLED and getattr(module, "CACHEABLE", False)
+
+
+def get_cache_files(module: ModuleType, args) -> tuple[list, list] | None:
+    if not hasattr(module, "get_cache_files"):
+        return [], []
+    return module.get_cache_files(args)
+
+
+def cache_key(pyfile: str, args: dict, input_files: list) -> str | None:
+    inputs = []
+    for filename in input_files:
+        fingerprint = file_fingerprint(filename)
+        if fingerprint is None:
+            return None  # missing input, let main() report it
+        inputs.append(fingerprint)
+
+    data = json.dumps([pyfile, args, inputs], sort_keys=True, default=str)
+    return sha256(data.encode("utf-8")).hexdigest()
+
+
+def entry_path(key: str) -> pt:
+    return RESULT_CACHE_DIR / f"{key}.json.gz"
+
+
+def get_cached_result(key: str, pyfile: str) -> dict | None:
+    path = entry_path(key)
+    if not path.exists():
+        count("misses", pyfile)
+        return None
+
+    try:
+        with gzip.open(path, "rb") as f:
+            entry = json.load(f)
+    except Exception as e:
+        logger.warning(f"Dropping unreadable cache entry {path.name}: {e}")
+        path.unlink(missing_ok=True)
+        count("misses", pyfile)
+        return None
+
+    for fingerprint in entry["outputs"]:
+        if file_fingerprint(fingerprint["path"]) != fingerprint:
+            logger.info(f"Cache entry for {pyfile} is stale: {fingerprint['path']}")
+            path.unlink(missing_ok=True)
+            count("misses", pyfile)
+            return None
+
+    os.utime(path)  # LRU order is kept by mtime
+    count("hits", pyfile)
+    logger.success(f"Using cached result for {pyfile}")
+    return entry["result"]
+
+
+def store_cached_result(key: str, pyfile: str, result: dict, output_files: list):
+    outputs = [file_fingerprint(filename) for filename in output_files]
+    entry = {
+        "pyfile": pyfile,
+        "created": time(),
+        "outputs": [fingerprint for fingerprint in outputs if fingerprint],
+        "result": result,
+    }
+
+    try:
+        RESULT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path = entry_path(key)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+            f.write(dumps_json(entry))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Could not cache result for {pyfile}: {e}")
+        return
+
+    count("stores", pyfile)
+    evict()
+
+
+def evict(
+    max_bytes: int = RESULT_CACHE_MAX_BYTES, max_entries: int = RESULT_CACHE_MAX_ENTRIES
+):
+    """Remove least recently used entries until the cache fits its limits"""
+    entries = []
+    for path in RESULT_CACHE_DIR.glob("*.json.gz"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    entries.sort()
+    total_bytes = sum(size for _, size, _ in entries)
+    while entries and (total_bytes > max_bytes or len(entries) > max_entries):
+        _, size, path = entries.pop(0)
+        path.unlink(missing_ok=True)
+        total_bytes -= size
+        count("evictions", "all")
+
+
+def get_cache_stats() -> dict:
+    try:
+        stats = {
+            key.decode(): int(value)
+            for key, value in get_redis().hgetall(STATS_KEY).items()
+        }
+    except Exception:
+        stats = dict(local_stats)
+
+    files = list(RESULT_CACHE_DIR.glob("*.json.gz"))
+    hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+    return {
+        "enabled": RESULT_CACHE_ENABLED,
+        "entries": len(files),
+        "size_mb": round(sum(f.stat().st_size for f in files) / 1024**2, 2),
+        "max_size_mb": RESULT_CACHE_MAX_BYTES / 1024**2,
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        "counts": stats,
+    }
+
+
+def clear_cache():
+    for path in RESULT_CACHE_DIR.glob("*.json.gz"):
+        path.unlink(missing_ok=True)
+    local_stats.clear()
+    try:
+        get_redis().delete(STATS_KEY)
+    except Exception:
+        pass
+    logger.info("Cleared compute result cache")
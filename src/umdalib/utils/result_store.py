@@ -0,0 +1,112 @@
+import gzip
+import json
+import os
+import re
+from hashlib import sha256
+from pathlib import Path as pt
+from time import time
+from typing import Iterator
+
+from umdalib.logger import Paths, logger
+from umdalib.utils.json import dumps_json
+
+# Results larger than this are written to RESULT_STORE_DIR and only a small
+# handle travels through Redis (RQ result + pubsub) and Socket.IO.
+INLINE_RESULT_MAX_BYTES = int(os.getenv("UMDAPY_INLINE_RESULT_MAX_BYTES", 64 * 1024))
+RESULT_STORE_DIR = Paths().app_log_dir / "job_results"
+RESULT_STORE_MAX_AGE = 7 * 24 * 60 * 60  # seconds
+PRUNE_INTERVAL = 60 * 60  # seconds
+
+# top-level keys copied into the handle so the UI can show the job status
+HANDLE_SUMMARY_KEYS = ["done", "error", "computed_time", "warnings"]
+
+last_prune_time = 0.0
+
+
+def result_path(result_id: str) -> pt:
+    if not re.fullmatch(r"[0-9a-f]{64}", result_id):
+        raise ValueError(f"Invalid result id: {result_id}")
+    return RESULT_STORE_DIR / f"{result_id}.json.gz"
+
+
+def is_result_handle(result) -> bool:
+    return isinstance(result, dict) and result.get("stored") is True
+
+
+def store_result(result: dict, job_id: str = None) -> dict:
+    """
+    Return the result unchanged if it is small, otherwise write it as gzipped
+    JSON (named by its sha256, so identical results are stored once) and return
+    a handle pointing to it.
+    """
+    data = dumps_json(result)
+    if len(data) <= INLINE_RESULT_MAX_BYTES:
+        return result
+
+    result_id = sha256(data).hexdigest()
+    path = result_path(result_id)
+    if path.exists():
+        os.utime(path)
+    else:
+        RESULT_STORE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    logger.info(
+        f"Stored {len(data) / 1024**2:.2f} MB result for job {job_id} as {path.name} "
+        f"({path.stat().st_size / 1024**2:.2f} MB compressed)"
+    )
+    prune_results()
+
+    handle = {
+        "stored": True,
+        "result_id": result_id,
+        "job_id": job_id,
+        "size": len(data),
+        "compressed_size": path.stat().st_size,
+        "keys": list(result),
+    }
+    for key in HANDLE_SUMMARY_KEYS:
+        if key in result:
+            handle[key] = result[key]
+    return handle
+
+
+def iter_result_chunks(result_id: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Decompress a stored result lazily, chunk by chunk"""
+    path = result_path(result_id)
+    os.utime(path)  # keep recently read results from being pruned
+    with gzip.open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def load_result(result: dict) -> dict:
+    """Resolve a handle to the full result (results that were not stored pass through)"""
+    if not is_result_handle(result):
+        return result
+    with gzip.open(result_path(result["result_id"]), "rb") as f:
+        return json.load(f)
+
+
+def prune_results(max_age: float = RESULT_STORE_MAX_AGE, force: bool = False):
+    """Delete stored results not written or read for max_age seconds"""
+    global last_prune_time
+
+    now = time()
+    if not force and now - last_prune_time < PRUNE_INTERVAL:
+        return
+    last_prune_time = now
+
+    if not RESULT_STORE_DIR.exists():
+        return
+
+    for path in RESULT_STORE_DIR.glob("*.json.gz"):
+        try:
+            if now - path.stat().st_mtime > max_age:
+                path.unlink()
+                logger.info(f"Pruned stored result {path.name}")
+        except OSError as e:
+            logger.warning(f"Could not prune {path.name}: {e}")
@@ -0,0 +1,169 @@
+import json
+import os
+import shutil
+from hashlib import sha256
+from math import ceil
+from pathlib import Path as pt
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+from umdalib.logger import logger
+from umdalib.vectorize_molecules.embedding_cache import EmbeddingCache
+from umdalib.utils.job_context import (
+    checkpoint_key,
+    raise_if_cancelled,
+    track_progress,
+)
+
+# SMILES are embedded EMBED_CHUNK_SIZE at a time and every finished chunk is
+# written as a shard (.<vectors_file stem>.shards/chunk_000000.npy) and listed
+# in the shard manifest. A crashed or cancelled run restarts from the first
+# missing chunk; the shards are copied into vectors_file once all are done.
+EMBED_CHUNK_SIZE = int(os.getenv("UMDAPY_EMBED_CHUNK_SIZE", 4096))
+SHARD_MANIFEST = "manifest.json"
+
+
+def shard_dir(vectors_file: str | pt) -> pt:
+    vectors_file = pt(vectors_file)
+    return vectors_file.with_name(f".{vectors_file.stem}.shards")
+
+
+def smiles_digest(smiles: pd.Series) -> str:
+    digest = sha256()
+    for smi in smiles:
+        digest.update(str(smi).encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+def as_matrix(vectors, nrows: int) -> np.ndarray:
+    """Embedder output (2D array, array of row vectors, ...) as (nrows, dim)"""
+    vectors = np.asarray(vectors)
+    if vectors.dtype == object:
+        vectors = np.vstack(vectors)
+    return vectors.reshape(nrows, -1)
+
+
+def write_json(filename: pt, data: dict):
+    tmp_file = filename.with_name(f".{filename.name}.{os.getpid()}.tmp")
+    tmp_file.write_text(json.dumps(data, indent=4))
+    os.replace(tmp_file, filename)
+
+
+def load_manifest(directory: pt, run_key: str, chunk_size: int) -> dict:
+    manifest_file = directory / SHARD_MANIFEST
+    if manifest_file.exists():
+        manifest = json.loads(manifest_file.read_text())
+        if manifest["key"] == run_key and manifest["chunk_size"] == chunk_size:
+            return manifest
+        logger.warning(f"Discarding shards of a different run in {directory}")
+        shutil.rmtree(directory)
+
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = {"key": run_key, "chunk_size": chunk_size, "chunks": []}
+    write_json(manifest_file, manifest)
+    return manifest
+
+
+def assemble(directory: pt, chunks: list[int], vectors_file: pt) -> np.ndarray:
+    """Copy the shards, in order, into vectors_file (never all in memory)"""
+    shards = [np.load(directory / f"chunk_{i:06d}.npy", mmap_mode="r") for i in chunks]
+    nrows = sum(shard.shape[0] for shard in shards)
+    dtype = np.result_type(*shards)
+    shape = (nrows, shards[0].shape[1])
+
+    tmp_file = vectors_file.with_name(f".{vectors_file.stem}.{os.getpid()}.tmp.npy")
+    output = open_memmap(tmp_file, mode="w+", dtype=dtype, shape=shape)
+    start = 0
+    for shard in shards:
+        output[start : start + shard.shape[0]] = shard
+        start += shard.shape[0]
+    output.flush()
+    del output, shards
+    os.replace(tmp_file, vectors_file)
+
+    shutil.rmtree(directory)
+    return np.load(vectors_file, mmap_mode="r")
+
+
+def split_columns(
+    source_file: pt, targets: list[tuple[pt, int]], chunk_rows: int = EMBED_CHUNK_SIZE
+):
+    """
+    Write consecutive column blocks of source_file to the target files, given
+    as (filename, width), a chunk of rows at a time. source_file is removed.
+    """
+    source = np.load(source_file, mmap_mode="r")
+    start = 0
+    for filename, width in targets:
+        tmp_file = filename.with_name(f".{filename.stem}.{os.getpid()}.tmp.npy")
+        shape = (source.shape[0], width)
+        output = open_memmap(tmp_file, mode="w+", dtype=source.dtype, shape=shape)
+        for row in range(0, source.shape[0], chunk_rows):
+            output[row : row + chunk_rows] = source[
+                row : row + chunk_rows, start : start + width
+            ]
+        output.flush()
+        del output
+        os.replace(tmp_file, filename)
+        start += width
+    del source
+    pt(source_file).unlink()
+
+
+def embed_in_chunks(
+    smiles: pd.Series,
+    embed_chunk: Callable[[pd.Series], np.ndarray],
+    vectors_file: str | pt,
+    run_key: tuple,
+    chunk_size: int = EMBED_CHUNK_SIZE,
+    cache: EmbeddingCache = None,
+) -> np.ndarray:
+    """
+    Embed smiles chunk by chunk with embed_chunk and save them to vectors_file.
+    run_key identifies the embedder (name, model file, ...): shards are only
+    reused by a run with the same run_key, chunk_size and SMILES.
+    With a cache, only SMILES it does not know yet are passed to embed_chunk.
+    Returns vectors_file memory-mapped.
+    """
+    if smiles.empty:
+        raise ValueError("No SMILES to embed")
+
+    vectors_file = pt(vectors_file)
+    directory = shard_dir(vectors_file)
+    key = checkpoint_key(*run_key, smiles_digest(smiles))
+    manifest = load_manifest(directory, key, chunk_size)
+
+    done = set(manifest["chunks"])
+    nchunks = ceil(len(smiles) / chunk_size)
+    if done:
+        logger.info(f"Resuming embedding: {len(done)}/{nchunks} chunks already done")
+
+    with track_progress(len(smiles), "Embedding SMILES") as progress:
+        progress.set(min(len(done) * chunk_size, len(smiles)))
+        for i in range(nchunks):
+            if i in done:
+                continue
+            raise_if_cancelled(f"Embedding stopped after {len(done)}/{nchunks} chunks")
+
+            chunk = smiles.iloc[i * chunk_size : (i + 1) * chunk_size]
+            if cache is not None:
+                vectors = cache.embed(chunk, embed_chunk)
+            else:
+                vectors = as_matrix(embed_chunk(chunk), len(chunk))
+
+            shard_file = directory / f"chunk_{i:06d}.npy"
+            tmp_file = directory / f".chunk_{i:06d}.{os.getpid()}.tmp.npy"
+            np.save(tmp_file, vectors)
+            os.replace(tmp_file, shard_file)
+
+            done.add(i)
+            manifest["chunks"] = sorted(done)
+            write_json(directory / SHARD_MANIFEST, manifest)
+            progress.update(len(chunk))
+
+    vectors = assemble(directory, list(range(nchunks)), vectors_file)
+    logger.success(f"Embedded numpy array saved to {vectors_file}")
+    return vectors
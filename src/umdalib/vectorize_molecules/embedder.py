@@ -3,14 +3,25 @@ from pathlib import Path as pt
 from time import perf_counter
 from typing import Literal, Union
 import numpy as np
-from dask import array as da
-from dask.diagnostics import ProgressBar
 from umdalib.load_file.read_data import read_as_ddf
+import dask
+from umdalib.vectorize_molecules.chunked import embed_in_chunks, split_columns
+from umdalib.vectorize_molecules.embedding_cache import get_embedding_cache
+from umdalib.vectorize_molecules.inference_backend import HF_BACKEND, backend_of
+from umdalib.vectorize_molecules.mol2vec_batch import mol2vec_partition
+from umdalib.utils.execution import dask_scheduler, embedding_workload, repartition
+from umdalib.utils.job_context import DaskProgress
 from umdalib.utils.json import safe_json_dump
 from umdalib.logger import logger
 import pandas as pd
 
-from umdalib.vectorize_molecules.vectorizer import get_smi_to_vec
+from umdalib.vectorize_molecules.vectorizer import (
+    DEFAULT_POOLING,
+    get_smi_to_vec,
+    mol2vec,
+    parse_pooling,
+    pooled_size,
+)
 import mapply
 
 mapply.init(n_workers=-1, chunk_size=100, max_chunks_per_worker=10, progressbar=True)
@@ -46,11 +57,20 @@ class Args:
     test_smiles: str
     embedd_savefile: str
     vectors_file: str
-    use_dask: bool
+    use_dask: bool  # dask runs skip the embedding cache and resumable shards
     index_col: str
+    # transformer embedders only, see vectorizer.POOLING_OPTIONS
+    pooling: list[str] | str = None
+    # "torch", "int8" or "onnx", see inference_backend (default UMDAPY_HF_BACKEND)
+    backend: str = None
 
 
 test_mode = False
+HF_EMBEDDINGS = ["ChemBERTa-zinc-base-v1", "MoLFormer-XL-both-10pct"]
+
+
+def pooled_vectors_file(vectors_file: pt, pooling: str) -> pt:
+    return vectors_file.with_name(f"{vectors_file.stem}_{pooling}{vectors_file.suffix}")
 
 
 def main(args: Args):
@@ -60,9 +80,19 @@ def main(args: Args):
 
     test_mode = args.test_mode
 
+    # several poolings are computed in one pass: the first is saved to
+    # vectors_file, the others next to it as <vectors_file stem>_<pooling>.npy
+    pooling, backend = None, None
+    if args.embedding in HF_EMBEDDINGS:
+        pooling = parse_pooling(getattr(args, "pooling", Args.pooling))
+        backend = getattr(args, "backend", Args.backend) or HF_BACKEND
+        logger.info(f"{pooling=}, {backend=}")
+
     smi_to_vector, model = get_smi_to_vec(
-        args.embedding, args.pretrained_model_location
+        args.embedding, args.pretrained_model_location, pooling, backend
     )
+    if backend:
+        backend = backend_of(model)  # falls back to torch if unusable
 
     if test_mode:
         logger.info(f"Testing with {args.test_smiles}")
@@ -80,42 +110,37 @@ def main(args: Args):
     fullfile = pt(args.filename)
     logger.info(f"Reading {fullfile} as {args.filetype}")
 
-    ddf = read_as_ddf(args.filetype, args.filename, args.key, use_dask=args.use_dask)
+    ddf = read_as_ddf(
+        args.filetype,
+        args.filename,
+        args.key,
+        use_dask=args.use_dask,
+        columns=[args.columnX, args.columnY, args.index_col],
+    )
 
     if args.index_col:
         ddf = ddf.set_index(args.index_col)
 
+    workload = embedding_workload(args.embedding)
     if args.use_dask:
-        logger.info(f"{args.npartitions=}")
-        ddf = ddf.repartition(npartitions=args.npartitions)
+        ddf = repartition(ddf, args.filename, workload)
 
-    vectors = None
     logger.info(f"Using {args.embedding} for embedding")
 
     logger.info(f"Using {smi_to_vector} for embedding")
     if not callable(smi_to_vector):
         raise ValueError(f"Unknown embedding model: {args.embedding}")
 
-    if args.use_dask:
-        vectors = ddf[args.columnX].apply(
-            smi_to_vector, args=(model,), meta=(None, np.float32)
-        )
-    else:
-        # for some reason, mapply is not faster with mol2vec embeddings
-        # if args.embedding == "mol2vec":
-        #     vectors = ddf[args.columnX].apply(smi_to_vector, args=(model,))
-        # else:
-        #     vectors = ddf[args.columnX].mapply(smi_to_vector, args=(model,))
-        vectors = smi_to_vector(ddf[args.columnX], model)
-
-    if vectors is None:
-        raise ValueError(f"Unknown embedding model: {args.embedding}")
-
     vectors_file = pt(args.vectors_file)
     embedding_loc = vectors_file.parent
     if not embedding_loc.exists():
         embedding_loc.mkdir(parents=True)
 
+    # all poolings side by side, split into their own files at the end
+    embedding_file = vectors_file
+    if pooling and len(pooling) > 1:
+        embedding_file = vectors_file.with_name(f".{vectors_file.stem}.pooled.npy")
+
     logger.info(f"{vectors_file=}")
     logger.info(f"Begin computing embeddings for {fullfile.stem}...")
     time = perf_counter()
@@ -123,19 +148,58 @@ def main(args: Args):
     y = y.apply(convert_to_float)
     vec_computed: np.ndarray = None
 
-    with ProgressBar():
-        if args.use_dask:
-            if isinstance(vectors, da.Array):
-                vec_computed = vectors.compute()
-            y = y.compute()
+    if args.use_dask:
+        # embedded partition by partition in one dask graph, the embedding
+        # cache and shard checkpoints of embed_in_chunks are not used
+        logger.warning("Embedding with dask: results are not cached or resumable")
+        if smi_to_vector is mol2vec:
+            # the model is loaded by each worker, not pickled into every task
+            vectors = ddf[args.columnX].map_partitions(
+                mol2vec_partition,
+                str(args.pretrained_model_location),
+                meta=(None, object),
+            )
         else:
-            vec_computed = vectors
-
-        # logger.info(f"{vec_computed.shape=}")
+            vectors = ddf[args.columnX].apply(
+                smi_to_vector, args=(model,), meta=(None, np.float32)
+            )
+        # one pass over the partitions for both the vectors and y
+        with DaskProgress("Computing embeddings"), dask_scheduler(workload):
+            vec_computed, y = dask.compute(vectors, y)
         vec_computed = np.vstack(vec_computed)
+        np.save(embedding_file, vec_computed)
+        logger.success(f"Embedded numpy array saved to {embedding_file}")
+    else:
+        # written shard by shard, an interrupted run resumes where it stopped
+        variant_parts = []
+        if pooling and pooling != DEFAULT_POOLING:
+            variant_parts.append(f"pooling:{','.join(pooling)}")
+        if backend and backend != "torch":
+            variant_parts.append(f"backend:{backend}")
+        variant = "|".join(variant_parts)
+        vec_computed = embed_in_chunks(
+            ddf[args.columnX],
+            lambda smiles: smi_to_vector(smiles, model),
+            embedding_file,
+            run_key=(args.embedding, args.pretrained_model_location, variant),
+            cache=get_embedding_cache(
+                args.embedding, args.pretrained_model_location, variant
+            ),
+        )
 
-        np.save(vectors_file, vec_computed)
-        logger.success(f"Embedded numpy array saved to {vectors_file}")
+    pooled_files = {}
+    if embedding_file != vectors_file:
+        pooled_files = {
+            name: pooled_vectors_file(vectors_file, name) for name in pooling[1:]
+        }
+        targets = [(vectors_file, pooled_size(model, pooling[0]))]
+        targets += [
+            (pooled_files[name], pooled_size(model, name)) for name in pooling[1:]
+        ]
+        del vec_computed
+        split_columns(embedding_file, targets)
+        vec_computed = np.load(vectors_file, mmap_mode="r")
+        logger.success(f"Pooled embeddings saved to {list(pooled_files.values())}")
 
     logger.info(f"{vec_computed.shape=}")
 
@@ -179,9 +243,11 @@ def main(args: Args):
         "filename": args.filename,
         "filetype": args.filetype,
         "key": args.key,
-        "npartitions": args.npartitions,
+        "npartitions": ddf.npartitions if args.use_dask else None,
         "columnX": args.columnX,
         "data_shape": vec_computed.shape,
+        "pooling": pooling,
+        "pooled_vectors_files": {name: str(f) for name, f in pooled_files.items()},
         "invalid_smiles": len(invalid_smiles),
         "invalid_smiles_file": str(invalid_smiles_filename),
     }
@@ -194,5 +260,6 @@ def main(args: Args):
             "invalid_smiles": len(invalid_smiles),
             "invalid_smiles_file": str(invalid_smiles_filename),
             "saved_file": str(vectors_file),
+            "pooled_files": {name: str(f) for name, f in pooled_files.items()},
         }
     }
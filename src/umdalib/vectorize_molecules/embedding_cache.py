@@ -0,0 +1,135 @@
+import os
+import sqlite3
+from hashlib import sha256
+from pathlib import Path as pt
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from umdalib.logger import Paths, logger
+from umdalib.utils.fingerprint import file_fingerprint
+
+# Embeddings computed once are kept in a SQLite database as float32 blobs,
+# keyed by a namespace (embedder name, content hash of the model file(s) and
+# variant such as a PCA pipeline or pooling) and the SMILES as given. SMILES
+# are not canonicalized: mol2vec embeds the unsanitized parse, so two spellings
+# of one molecule (Kekule / aromatic) can have different embeddings.
+# Set UMDAPY_EMBEDDING_CACHE=0 to disable it.
+EMBEDDING_CACHE_ENABLED = os.getenv("UMDAPY_EMBEDDING_CACHE", "1").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+EMBEDDING_CACHE_FILE = pt(
+    os.getenv(
+        "UMDAPY_EMBEDDING_CACHE_FILE",
+        Paths().app_log_dir / "embedding_cache.sqlite",
+    )
+)
+SQL_BATCH_SIZE = 500  # keys per SELECT, below SQLite's parameter limit
+
+
+def normalize_smiles(smi) -> str:
+    return str(smi).replace("\xa0", "").strip()
+
+
+def model_hash(model_file: str | pt) -> str:
+    """Content hash of a model file, or of all files in a model directory"""
+    model_file = pt(model_file)
+    files = [model_file]
+    if model_file.is_dir():
+        files = sorted(path for path in model_file.rglob("*") if path.is_file())
+
+    digest = sha256()
+    for filename in files:
+        digest.update(file_fingerprint(filename)["sha256"].encode())
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """SMILES -> vector store of one embedder, model and variant"""
+
+    def __init__(self, embedder: str, model_file: str | pt, variant: str = ""):
+        self.embedder = embedder
+        parts = [embedder, model_hash(model_file), variant]
+        self.namespace = sha256("|".join(parts).encode()).hexdigest()[:32]
+        self.conn: sqlite3.Connection = None
+
+    def connect(self) -> sqlite3.Connection:
+        if self.conn is None:
+            EMBEDDING_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(EMBEDDING_CACHE_FILE, timeout=60)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "namespace TEXT, smiles TEXT, vector BLOB, "
+                "PRIMARY KEY (namespace, smiles)) WITHOUT ROWID"
+            )
+        return self.conn
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        conn = self.connect()
+        found = {}
+        for start in range(0, len(keys), SQL_BATCH_SIZE):
+            batch = keys[start : start + SQL_BATCH_SIZE]
+            rows = conn.execute(
+                "SELECT smiles, vector FROM embeddings WHERE namespace = ? "
+                f"AND smiles IN ({','.join('?' * len(batch))})",
+                [self.namespace, *batch],
+            )
+            for smiles, vector in rows:
+                found[smiles] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, vectors: dict[str, np.ndarray]):
+        rows = [
+            (self.namespace, key, np.asarray(vector, dtype=np.float32).tobytes())
+            for key, vector in vectors.items()
+        ]
+        with self.connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+
+    def embed(
+        self, smiles: pd.Series, embed_fn: Callable[[pd.Series], np.ndarray]
+    ) -> np.ndarray:
+        """
+        (len(smiles), dim) float32 vectors, only the SMILES missing from the
+        cache are passed (once each) to embed_fn
+        """
+        keys = [normalize_smiles(smi) for smi in smiles]
+        unique_keys = list(dict.fromkeys(keys))
+        found = self.get_many(unique_keys)
+
+        missing = [key for key in unique_keys if key not in found]
+        logger.info(
+            f"Embedding cache: {len(unique_keys) - len(missing)} hits, "
+            f"{len(missing)} misses"
+        )
+        if missing:
+            # embed one original SMILES per missing key
+            originals = dict(zip(keys, smiles))
+            new_smiles = pd.Series([originals[key] for key in missing])
+            new_vectors = np.asarray(embed_fn(new_smiles))
+            if new_vectors.dtype == object:
+                new_vectors = np.vstack(new_vectors)
+            new_vectors = new_vectors.reshape(len(missing), -1).astype(np.float32)
+
+            new = dict(zip(missing, new_vectors))
+            self.put_many(new)
+            found.update(new)
+
+        return np.vstack([found[key] for key in keys])
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def get_embedding_cache(
+    embedder: str, model_file: str | pt, variant: str = ""
+) -> EmbeddingCache | None:
+    if not EMBEDDING_CACHE_ENABLED or not model_file or not pt(model_file).exists():
+        return None
+    return EmbeddingCache(embedder, model_file, variant)
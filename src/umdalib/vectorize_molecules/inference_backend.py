@@ -0,0 +1,238 @@
+import json
+import os
+from pathlib import Path as pt
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+from transformers import PreTrainedModel, PreTrainedTokenizer
+
+from umdalib.logger import logger
+from umdalib.vectorize_molecules.embedding_cache import model_hash
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+# Optional faster CPU backends for the transformer embedders:
+#   "int8"  dynamic int8 quantization of the Linear layers (torch)
+#   "onnx"  ONNX export run by onnxruntime's CPU provider (pip install .[onnx])
+# The exported model is kept next to the pretrained model, in
+# <pretrained_file>.<backend>/, and is only used if its embeddings of
+# VALIDATION_SMILES agree with the float32 model (cosine similarity of at
+# least BACKEND_MIN_COSINE) for every pooling the job asks for; otherwise the
+# torch model is used. The manifest keeps the result per pooling.
+HF_BACKEND = os.getenv("UMDAPY_HF_BACKEND", "torch")
+BACKENDS = ["torch", "int8", "onnx"]
+BACKEND_MIN_COSINE = {"int8": 0.98, "onnx": 0.9999}
+ONNX_OPSET = 17
+VALIDATION_SMILES = [
+    "C",
+    "CCO",
+    "c1ccccc1",
+    "CC(=O)Oc1ccccc1C(=O)O",
+    "CN1C=NC2=C1C(=O)N(C(=O)N2C)C",
+    "C#N",
+    "O=C=O",
+    "C1CCC2(CC1)CCCC2",
+    "[NH4+]",
+    "CC(C)(C)c1ccc(O)cc1",
+    "N#CC(=O)[O-]",
+    "C=CC=CC=CC=C",
+]
+
+
+class OnnxModel:
+    """onnxruntime session called like the transformers model it was exported from"""
+
+    def __init__(self, onnx_file: pt, config, num_threads: int = 0):
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            str(onnx_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.config = config
+        self.name_or_path = str(onnx_file)
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+    def __call__(self, input_ids, attention_mask, **kwargs):
+        (last_hidden_state,) = self.session.run(
+            ["last_hidden_state"],
+            {
+                "input_ids": input_ids.cpu().numpy(),
+                "attention_mask": attention_mask.cpu().numpy(),
+            },
+        )
+        return SimpleNamespace(last_hidden_state=torch.from_numpy(last_hidden_state))
+
+
+def backend_of(model) -> str:
+    if isinstance(model, OnnxModel):
+        return "onnx"
+    quantized_linear = torch.ao.nn.quantized.dynamic.Linear
+    if any(isinstance(module, quantized_linear) for module in model.modules()):
+        return "int8"
+    return "torch"
+
+
+def export_onnx(model: PreTrainedModel, tokenizer: PreTrainedTokenizer, onnx_file):
+    inputs = tokenizer(VALIDATION_SMILES[:2], return_tensors="pt", padding=True)
+    dynamic_axes = {"batch": 0, "sequence": 1}
+    torch.onnx.export(
+        model,
+        (inputs["input_ids"], inputs["attention_mask"]),
+        str(onnx_file),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": dynamic_axes,
+            "attention_mask": dynamic_axes,
+            "last_hidden_state": dynamic_axes,
+        },
+        opset_version=ONNX_OPSET,
+    )
+
+
+def pool_hidden_states(outputs, attention_mask: torch.Tensor, pooling: str):
+    hidden = outputs.last_hidden_state
+    if pooling == "cls":
+        return hidden[:, 0]
+    if pooling.startswith("cls_last"):
+        last_layers = int(pooling.removeprefix("cls_last"))
+        return torch.cat(
+            [layer[:, 0] for layer in outputs.hidden_states[-last_layers:]], dim=-1
+        )
+
+    mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+    if pooling == "mean":
+        return (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+    return hidden.masked_fill(mask == 0, float("-inf")).max(dim=1).values
+
+
+def validation_embeddings(
+    model, tokenizer: PreTrainedTokenizer, pooling: list[str]
+) -> dict[str, np.ndarray]:
+    """Embeddings of VALIDATION_SMILES for each pooling"""
+    inputs = tokenizer(VALIDATION_SMILES, return_tensors="pt", padding=True)
+    all_layers = any(name.startswith("cls_last") for name in pooling)
+    with torch.inference_mode():
+        outputs = model(
+            input_ids=inputs["input_ids"],
+            attention_mask=inputs["attention_mask"],
+            output_hidden_states=all_layers,
+        )
+        return {
+            name: pool_hidden_states(outputs, inputs["attention_mask"], name)
+            .float()
+            .numpy()
+            for name in pooling
+        }
+
+
+def min_cosine(a: np.ndarray, b: np.ndarray) -> float:
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return float(np.min(np.sum(a * b, axis=1) / np.maximum(norms, 1e-12)))
+
+
+def build_backend(model, tokenizer, backend: str, directory: pt, num_threads: int):
+    if backend == "int8":
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    onnx_file = directory / "model.onnx"
+    if not onnx_file.exists():
+        logger.info(f"Exporting {model.name_or_path} to {onnx_file}")
+        export_onnx(model, tokenizer, onnx_file)
+    return OnnxModel(onnx_file, model.config, num_threads)
+
+
+def load_inference_backend(
+    model: PreTrainedModel,
+    tokenizer: PreTrainedTokenizer,
+    pretrained_file: str | pt,
+    backend: str = None,
+    pooling: list[str] = None,
+    num_threads: int = 0,
+):
+    """model, or its int8 / ONNX counterpart if it is usable and validated"""
+    backend = backend or HF_BACKEND
+    pooling = pooling or ["cls"]
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown inference backend {backend!r}, use one of {BACKENDS}"
+        )
+    if backend == "torch":
+        return model
+
+    if backend == "onnx" and onnxruntime is None:
+        logger.warning("onnxruntime is not installed, using the torch model")
+        return model
+    if backend == "onnx" and any(name.startswith("cls_last") for name in pooling):
+        logger.warning("The ONNX backend has no hidden layers, using the torch model")
+        return model
+
+    pretrained_file = pt(pretrained_file)
+    directory = pretrained_file.with_name(f"{pretrained_file.name}.{backend}")
+    manifest_file = directory / "manifest.json"
+    source_hash = model_hash(pretrained_file)
+
+    manifest = {}
+    try:
+        directory.mkdir(exist_ok=True)
+        if manifest_file.exists():
+            manifest = json.loads(manifest_file.read_text())
+        if manifest.get("model_hash") != source_hash:
+            manifest = {}
+            (directory / "model.onnx").unlink(missing_ok=True)
+    except (OSError, ValueError) as e:
+        # e.g. a read-only or shared model directory
+        logger.warning(f"Cannot use {directory} for the {backend} backend: {e}")
+        return model
+    # pooling name -> {"min_cosine", "passed"}
+    checked: dict[str, dict] = manifest.get("pooling", {})
+    if any(not checked[name]["passed"] for name in pooling if name in checked):
+        logger.warning(f"{backend} backend failed validation before, using torch")
+        return model
+
+    model.eval()
+    try:
+        fast_model = build_backend(model, tokenizer, backend, directory, num_threads)
+        unchecked = [name for name in pooling if name not in checked]
+        if unchecked:
+            expected = validation_embeddings(model, tokenizer, unchecked)
+            embedded = validation_embeddings(fast_model, tokenizer, unchecked)
+            for name in unchecked:
+                cosine = min_cosine(expected[name], embedded[name])
+                checked[name] = {
+                    "min_cosine": cosine,
+                    "passed": cosine >= BACKEND_MIN_COSINE[backend],
+                }
+            manifest = {
+                "backend": backend,
+                "model_hash": source_hash,
+                "torch": torch.__version__,
+                "pooling": checked,
+            }
+            manifest_file.write_text(json.dumps(manifest, indent=4))
+    except Exception as e:
+        logger.error(f"Could not build the {backend} backend: {e}")
+        return model
+
+    cosine = min(checked[name]["min_cosine"] for name in pooling)
+    if not all(checked[name]["passed"] for name in pooling):
+        logger.warning(
+            f"{backend} backend disagrees with the model (min cosine "
+            f"{cosine:.5f}), using torch"
+        )
+        return model
+
+    logger.success(f"Using {backend} backend (min cosine {cosine:.5f})")
+    return fast_model
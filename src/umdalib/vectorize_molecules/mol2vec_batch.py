@@ -0,0 +1,152 @@
+import atexit
+import multiprocessing
+from functools import lru_cache
+from multiprocessing.pool import Pool
+
+import numpy as np
+import pandas as pd
+from gensim.models import word2vec
+from mol2vec import features
+from rdkit import Chem, RDLogger
+
+from umdalib.logger import logger
+from umdalib.utils.job_context import raise_if_cancelled
+
+RDLogger.DisableLog("rdApp.*")
+
+# mol2vec for many SMILES at once: sentences are generated by a pool of spawned
+# worker processes kept between calls (RDKit parsing is the CPU bound part),
+# then all word vectors of a block of molecules are gathered from
+# model.wv.vectors in one indexing operation and summed per molecule, straight
+# into a float32 output matrix.
+SENTENCE_CHUNK_SIZE = 500  # SMILES per worker task
+PARALLEL_MIN_SMILES = 2000  # fewer SMILES are parsed in this process
+GATHER_BLOCK_SIZE = 4096  # molecules per gather, bounds the temporary memory
+
+pool: Pool = None
+pool_processes: int = None
+
+
+def mol2vec_sentence(smi, radius: int = 1) -> list[str]:
+    """Morgan identifier sentence of smi, empty for invalid SMILES"""
+    smi = str(smi).replace("\xa0", "")
+    if smi == "nan":
+        return []
+
+    # Molecule from SMILES will break on "bad" SMILES; this tries
+    # to get around sanitization (which takes a while) if it can
+    try:
+        mol = Chem.MolFromSmiles(smi, sanitize=False)
+        mol.UpdatePropertyCache(strict=False)
+        Chem.GetSymmSSSR(mol)
+        return features.mol2alt_sentence(mol, radius)
+    except Exception:
+        return []
+
+
+def sentences_of_chunk(task: tuple[list, int]) -> list[list[str]]:
+    smiles, radius = task
+    return [mol2vec_sentence(smi, radius) for smi in smiles]
+
+
+def close_pool():
+    global pool, pool_processes
+    if pool is not None:
+        pool.terminate()
+        pool = None
+        pool_processes = None
+
+
+def get_pool(processes: int) -> Pool:
+    """Sentence worker pool, kept between calls"""
+    global pool, pool_processes
+    if pool is not None and pool_processes == processes:
+        return pool
+
+    close_pool()
+    logger.info(f"Starting {processes} mol2vec workers")
+    # spawned, not forked from a process that may hold torch/gensim state
+    ctx = multiprocessing.get_context("spawn")
+    pool = ctx.Pool(processes)
+    pool_processes = processes
+    return pool
+
+
+atexit.register(close_pool)
+
+
+def mol2vec_sentences(
+    smiles: list, radius: int = 1, n_jobs: int = None
+) -> list[list[str]]:
+    if len(smiles) < PARALLEL_MIN_SMILES or n_jobs == 1:
+        return sentences_of_chunk((smiles, radius))
+
+    n_jobs = n_jobs or max(multiprocessing.cpu_count() - 1, 1)
+    tasks = [
+        (smiles[i : i + SENTENCE_CHUNK_SIZE], radius)
+        for i in range(0, len(smiles), SENTENCE_CHUNK_SIZE)
+    ]
+    sentences = []
+    try:
+        for chunk in get_pool(n_jobs).imap(sentences_of_chunk, tasks):
+            sentences.extend(chunk)
+            raise_if_cancelled()
+    except BaseException:
+        close_pool()  # do not leave workers busy with a stopped job
+        raise
+    return sentences
+
+
+def mol2vec_vectors(
+    smiles, model, radius: int = 1, unseen: str = None, n_jobs: int = None
+) -> np.ndarray:
+    """
+    (len(smiles), vector_size) float32 mol2vec embeddings. Words missing from
+    the vocabulary are skipped, or replaced by the unseen word (e.g. "UNK")
+    if given; molecules without any known word (or invalid) are all zeros.
+    """
+    smiles = list(smiles)
+    sentences = mol2vec_sentences(smiles, radius, n_jobs)
+
+    word_rows = model.wv.key_to_index
+    unseen_row = word_rows.get(unseen) if unseen else None
+    word_vectors = model.wv.vectors
+
+    output = np.zeros((len(smiles), model.vector_size), dtype=np.float32)
+    for start in range(0, len(sentences), GATHER_BLOCK_SIZE):
+        rows, owners = [], []
+        for i, sentence in enumerate(sentences[start : start + GATHER_BLOCK_SIZE]):
+            for word in sentence:
+                row = word_rows.get(word, unseen_row)
+                if row is not None:
+                    rows.append(row)
+                    owners.append(start + i)
+        if not rows:
+            continue
+
+        # owners is sorted, so each molecule's words are one contiguous segment
+        molecules, segment_starts = np.unique(owners, return_index=True)
+        output[molecules] = np.add.reduceat(
+            word_vectors[rows], segment_starts, axis=0, dtype=np.float32
+        )
+
+    invalid = len(smiles) - np.count_nonzero(output.any(axis=1))
+    if invalid:
+        logger.warning(f"{invalid}/{len(smiles)} SMILES gave no mol2vec embedding")
+    return output
+
+
+@lru_cache(maxsize=2)
+def load_mol2vec_model(model_file: str) -> word2vec.Word2Vec:
+    return word2vec.Word2Vec.load(model_file)
+
+
+def mol2vec_partition(smiles: pd.Series, model_file: str, radius: int = 1):
+    """
+    mol2vec vectors of a dask partition, as a Series of rows. The model is
+    loaded from model_file once per worker process instead of being pickled
+    into every partition task.
+    """
+    model = load_mol2vec_model(str(model_file))
+    vectors = mol2vec_vectors(smiles, model, radius, n_jobs=1)
+    return pd.Series(list(vectors), index=smiles.index)
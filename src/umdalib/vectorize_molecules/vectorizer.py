@@ -1,7 +1,5 @@
-from typing import List
+import os
 import numpy as np
-from rdkit import Chem
-from mol2vec import features
 from umdalib.logger import logger
 from pathlib import Path as pt
 import joblib
@@ -9,95 +7,144 @@ from gensim.models import word2vec
 from transformers import AutoTokenizer, AutoModel, PreTrainedModel, PreTrainedTokenizer
 import torch
 import pandas as pd
-import mapply
-from tqdm import tqdm
 
-mapply.init(n_workers=-1, chunk_size=100, max_chunks_per_worker=10, progressbar=True)
+from umdalib.utils.job_context import raise_if_cancelled
+from umdalib.vectorize_molecules.inference_backend import (
+    OnnxModel,
+    load_inference_backend,
+    pool_hidden_states,
+)
+from umdalib.vectorize_molecules.mol2vec_batch import mol2vec_vectors
+from umdalib.vectorize_molecules.vicgae_pool import embed_one, vicgae_vectors
 
 
-def VICGAE2vec(df: pd.Series | str, model):
-    def func(smi: str):
-        smi = str(smi).replace("\xa0", "")
-        if smi == "nan":
-            return np.zeros(32)
-        try:
-            return model.embed_smiles(smi).numpy().reshape(-1)
-        except Exception as _:
-            return np.zeros(32)
+# transformer inference: batches hold at most HF_TOKEN_BUDGET (padded) tokens,
+# UMDAPY_TORCH_THREADS sets the intra-op threads (0 keeps the torch default)
+HF_TOKEN_BUDGET = int(os.getenv("UMDAPY_HF_TOKEN_BUDGET", 16384))
+HF_MAX_BATCH_SIZE = 256
+HF_NUM_THREADS = int(os.getenv("UMDAPY_TORCH_THREADS", 0))
+
+# pooling of the transformer hidden states: "cls", "mean" (attention mask
+# aware), "max" (over real tokens) or "cls_last<K>" (CLS of the last K layers
+# concatenated). Several poolings come out of one forward pass, side by side.
+POOLING_OPTIONS = ["cls", "mean", "max", "cls_last<K>"]
+DEFAULT_POOLING = ["cls"]
 
-    if isinstance(df, str):
-        return func(df)
-
-    return df.mapply(func).to_numpy()
-
-
-def mol2vec(df: pd.Series | str, model, radius=1) -> List[np.ndarray]:
-    def func(smi: str):
-        smi = str(smi).replace("\xa0", "")
-        if smi == "nan":
-            return np.zeros(model.vector_size)
-
-        # Molecule from SMILES will break on "bad" SMILES; this tries
-        # to get around sanitization (which takes a while) if it can
-        try:
-            mol = Chem.MolFromSmiles(smi, sanitize=False)
-            mol.UpdatePropertyCache(strict=False)
-            Chem.GetSymmSSSR(mol)
-            # generate a sentence from rdkit molecule
-            sentence = features.mol2alt_sentence(mol, radius)
-            # generate vector embedding from sentence and model
-            vector = features.sentences2vec([sentence], model)
-            vector = vector.reshape(-1)
-            if len(vector) == 1:
-                logger.error(f"Vector length is {len(vector)} for {smi}")
-                raise ValueError(f"Invalid embedding: {smi}")
-            return vector
-
-        except Exception as _:
-            return np.zeros(model.vector_size)
 
+def VICGAE2vec(df: pd.Series | str, model):
     if isinstance(df, str):
-        return func(df)
+        return embed_one(model, df)
+
+    # worker processes load the model themselves, only SMILES are sent
+    return vicgae_vectors(df, vicgae_model_file, model)
 
-    # for some reason, mapply is not faster with mol2vec embeddings
-    return df.apply(func).to_numpy()
+
+def mol2vec(df: pd.Series | str, model, radius=1) -> np.ndarray:
+    if isinstance(df, str):
+        return mol2vec_vectors([df], model, radius)[0]
+    return mol2vec_vectors(df, model, radius)
+
+
+def token_budget_batches(
+    lengths: np.ndarray, token_budget: int, max_batch_size: int
+) -> list[np.ndarray]:
+    """
+    Indices of the inputs sorted by length and cut into batches whose padded
+    size (rows * longest row) stays within token_budget
+    """
+    if not len(lengths):
+        return []
+    order = np.argsort(lengths, kind="stable")
+    batches, start = [], 0
+    for end in range(1, len(order) + 1):
+        rows = end - start
+        padded_size = rows * lengths[order[end - 1]]
+        if rows > 1 and (padded_size > token_budget or rows > max_batch_size):
+            batches.append(order[start : end - 1])
+            start = end - 1
+    batches.append(order[start:])
+    return batches
+
+
+def parse_pooling(pooling: str | list[str] | None) -> list[str]:
+    """["cls", "mean"] from "cls,mean" (or a list), validated"""
+    if not pooling:
+        return list(DEFAULT_POOLING)
+    if isinstance(pooling, str):
+        pooling = pooling.split(",")
+    pooling = list(dict.fromkeys(name.strip().lower() for name in pooling))
+    for name in pooling:
+        last_layers = name.removeprefix("cls_last")
+        if name not in POOLING_OPTIONS and not (
+            name.startswith("cls_last") and last_layers.isdigit()
+        ):
+            raise ValueError(f"Unknown pooling {name!r}, use one of {POOLING_OPTIONS}")
+    return pooling
+
+
+def pooled_size(model: PreTrainedModel, pooling: str) -> int:
+    if pooling.startswith("cls_last"):
+        return model.config.hidden_size * int(pooling.removeprefix("cls_last"))
+    return model.config.hidden_size
 
 
 def molecules_to_vectors_using_huggingface(
     model: PreTrainedModel,
     tokenizer: PreTrainedTokenizer,
     smiles: list[str],
-    batch_size: int = 64,
+    token_budget: int = HF_TOKEN_BUDGET,
+    max_batch_size: int = HF_MAX_BATCH_SIZE,
     device: str = "cpu",  # or "cuda" if GPU is available
+    pooling: list[str] = DEFAULT_POOLING,
 ):
-    model = model.to(device)
-    all_embeddings = []
-    progress = 0
-    for i in tqdm(range(0, len(smiles), batch_size), desc="Embedding SMILES"):
-        batch = smiles[i : i + batch_size]
-        inputs = tokenizer(
-            batch, return_tensors="pt", padding=True, truncation=True
-        ).to(device)
-
-        with torch.no_grad():
-            outputs = model(**inputs)
-            # you can experiment with mean, max, or CLS:
-            # embeds = out.last_hidden_state.mean(dim=1).cpu().detach().numpy()
-            embeds = outputs.last_hidden_state[:, 0, :].cpu().numpy()
-            all_embeddings.append(embeds)
-
-        # current progress for batch
-        progress += len(batch) / len(smiles) * 100
-        logger.info(f"Progress: {progress:.2f}%")
-
-    all_embeddings = np.vstack(all_embeddings)
-    all_embeddings = all_embeddings.squeeze()
-    logger.info(f"{all_embeddings.shape=}")
-    return all_embeddings
-
-
-hf_model: PreTrainedModel | None = None
+    """
+    Embeddings of smiles, one block of columns per pooling (in that order).
+    The SMILES are tokenized once, grouped by token length so batches carry
+    little padding, and the embeddings are written back in input order into
+    a float32 array.
+    """
+    model = model.to(device).eval()
+    if HF_NUM_THREADS:
+        torch.set_num_threads(HF_NUM_THREADS)
+
+    width = sum(pooled_size(model, name) for name in pooling)
+    output = np.empty((len(smiles), width), dtype=np.float32)
+    if not len(smiles):
+        return output
+
+    encoded = tokenizer(list(smiles), truncation=True)
+    lengths = np.array([len(ids) for ids in encoded["input_ids"]])
+    batches = token_budget_batches(lengths, token_budget, max_batch_size)
+
+    all_layers = any(name.startswith("cls_last") for name in pooling)
+    # progress and resuming are handled per chunk by chunked.embed_in_chunks
+    done = 0
+    for batch in batches:
+        raise_if_cancelled(f"Embedding stopped after {done}/{len(smiles)} SMILES")
+
+        features = {key: [encoded[key][i] for i in batch] for key in encoded.keys()}
+        inputs = tokenizer.pad(features, return_tensors="pt").to(device)
+        with torch.inference_mode():
+            outputs = model(**inputs, output_hidden_states=all_layers)
+            pooled = [
+                pool_hidden_states(outputs, inputs["attention_mask"], name)
+                for name in pooling
+            ]
+            output[batch] = torch.cat(pooled, dim=-1).float().cpu().numpy()
+        done += len(batch)
+
+    padded_tokens = sum(len(batch) * lengths[batch].max() for batch in batches)
+    logger.info(
+        f"Embedded {len(smiles)} SMILES in {len(batches)} batches "
+        f"({lengths.sum() / padded_tokens:.0%} of the tokens are not padding)"
+    )
+    return output.squeeze()
+
+
+hf_model: PreTrainedModel | OnnxModel | None = None
 hf_tokenizer: PreTrainedTokenizer | None = None
+hf_pooling: list[str] = DEFAULT_POOLING
+vicgae_model_file: str | None = None
 
 
 def hf_func(df: pd.Series | str, model=None):
@@ -106,11 +153,15 @@ def hf_func(df: pd.Series | str, model=None):
         smiles = [df]
     else:
         smiles = df.tolist()
-    return molecules_to_vectors_using_huggingface(hf_model, hf_tokenizer, smiles)
+    return molecules_to_vectors_using_huggingface(
+        hf_model, hf_tokenizer, smiles, pooling=hf_pooling
+    )
 
 
-def get_smi_to_vec(embedding, pretrained_file):
-    global hf_model, hf_tokenizer
+def get_smi_to_vec(
+    embedding, pretrained_file, pooling: list[str] = None, backend: str = None
+):
+    global hf_model, hf_tokenizer, hf_pooling, vicgae_model_file
 
     logger.info(f"Loading model from {pretrained_file}")
     if not pt(pretrained_file).exists():
@@ -121,6 +172,7 @@ def get_smi_to_vec(embedding, pretrained_file):
     model = None
     hf_model = None
     hf_tokenizer = None
+    hf_pooling = parse_pooling(pooling)
     smi_to_vector = None
 
     if embedding == "mol2vec":
@@ -129,6 +181,7 @@ def get_smi_to_vec(embedding, pretrained_file):
         smi_to_vector = mol2vec
     elif embedding == "VICGAE":
         model = joblib.load(pretrained_file)
+        vicgae_model_file = str(pretrained_file)
         logger.info("Loaded VICGAE model")
         smi_to_vector = VICGAE2vec
     elif embedding == "ChemBERTa-zinc-base-v1":
@@ -165,7 +218,16 @@ def get_smi_to_vec(embedding, pretrained_file):
             raise ValueError(
                 f"HuggingFace model or tokenizer not found for {embedding}"
             )
+        hf_model = load_inference_backend(
+            hf_model,
+            hf_tokenizer,
+            pretrained_file,
+            backend,
+            pooling=hf_pooling,
+            num_threads=HF_NUM_THREADS,
+        )
         smi_to_vector = hf_func
+        model = hf_model  # hf_func ignores it, returned for its config
 
     if smi_to_vector is None:
         raise ValueError(f"Unknown embedding model: {embedding}")
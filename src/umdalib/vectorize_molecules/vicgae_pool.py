@@ -0,0 +1,131 @@
+import atexit
+import multiprocessing
+from multiprocessing.pool import Pool
+from pathlib import Path as pt
+
+import joblib
+import numpy as np
+import torch
+
+from umdalib.logger import logger
+from umdalib.utils.job_context import raise_if_cancelled
+
+# VICGAE embeddings in a pool of worker processes that each load the model once
+# (pool initializer) and keep it for every later call; only SMILES go to the
+# workers and float32 blocks of VICGAE_BATCH_SIZE rows come back, in order.
+# Models whose embed_smiles accepts a list are called once per block.
+VICGAE_DIM = 32
+VICGAE_BATCH_SIZE = 256  # SMILES per worker task
+PARALLEL_MIN_SMILES = 2000  # fewer SMILES are embedded in this process
+
+worker_model = None
+worker_batched: bool = None
+
+pool: Pool = None
+pool_model_file: str = None
+
+
+def clean_smiles(smi) -> str:
+    return str(smi).replace("\xa0", "")
+
+
+def embed_one(model, smi) -> np.ndarray:
+    smi = clean_smiles(smi)
+    if smi == "nan":
+        return np.zeros(VICGAE_DIM, dtype=np.float32)
+    try:
+        return model.embed_smiles(smi).numpy().reshape(-1)
+    except Exception:
+        return np.zeros(VICGAE_DIM, dtype=np.float32)
+
+
+def supports_batches(model) -> bool:
+    """Whether model.embed_smiles takes a list of SMILES (one row per SMILES)"""
+    try:
+        with torch.inference_mode():
+            vectors = model.embed_smiles(["C", "CC"])
+        return tuple(vectors.shape) == (2, VICGAE_DIM)
+    except Exception:
+        return False
+
+
+def embed_block(model, smiles: list, batched: bool) -> np.ndarray:
+    output = np.zeros((len(smiles), VICGAE_DIM), dtype=np.float32)
+    with torch.inference_mode():
+        if batched:
+            valid = [i for i, smi in enumerate(smiles) if clean_smiles(smi) != "nan"]
+            try:
+                vectors = model.embed_smiles([clean_smiles(smiles[i]) for i in valid])
+                output[valid] = vectors.numpy().reshape(len(valid), -1)
+                return output
+            except Exception:
+                pass  # an invalid SMILES in the block, embed them one by one
+
+        for i, smi in enumerate(smiles):
+            output[i] = embed_one(model, smi)
+    return output
+
+
+def init_worker(model_file: str):
+    global worker_model, worker_batched
+    torch.set_num_threads(1)  # the workers are the parallelism
+    worker_model = joblib.load(model_file)
+    worker_batched = supports_batches(worker_model)
+
+
+def embed_in_worker(smiles: list) -> np.ndarray:
+    return embed_block(worker_model, smiles, worker_batched)
+
+
+def close_pool():
+    global pool, pool_model_file
+    if pool is not None:
+        pool.terminate()
+        pool = None
+        pool_model_file = None
+
+
+def get_pool(model_file: str) -> Pool:
+    """Worker pool with model_file loaded, kept between calls"""
+    global pool, pool_model_file
+    model_file = str(pt(model_file).resolve())
+    if pool is not None and pool_model_file == model_file:
+        return pool
+
+    close_pool()
+    processes = max(multiprocessing.cpu_count() - 1, 1)
+    logger.info(f"Starting {processes} VICGAE workers")
+    ctx = multiprocessing.get_context("spawn")
+    pool = ctx.Pool(processes, initializer=init_worker, initargs=(model_file,))
+    pool_model_file = model_file
+    return pool
+
+
+atexit.register(close_pool)
+
+
+def vicgae_vectors(smiles, model_file: str, model=None) -> np.ndarray:
+    """
+    (len(smiles), VICGAE_DIM) float32 embeddings, all zeros for invalid
+    SMILES. model (already loaded) is used for inputs too small for the pool.
+    """
+    smiles = list(smiles)
+    if len(smiles) < PARALLEL_MIN_SMILES:
+        model = model if model is not None else joblib.load(model_file)
+        return embed_block(model, smiles, supports_batches(model))
+
+    blocks = [
+        smiles[i : i + VICGAE_BATCH_SIZE]
+        for i in range(0, len(smiles), VICGAE_BATCH_SIZE)
+    ]
+    output = np.empty((len(smiles), VICGAE_DIM), dtype=np.float32)
+    start = 0
+    try:
+        for block in get_pool(model_file).imap(embed_in_worker, blocks):
+            output[start : start + len(block)] = block
+            start += len(block)
+            raise_if_cancelled()
+    except BaseException:
+        close_pool()  # do not leave workers busy with a stopped job
+        raise
+    return output
@@ -1,12 +1,51 @@
+import atexit
 import json
+import multiprocessing
+import os
+import queue
+import traceback
+from multiprocessing.context import SpawnContext
+from time import monotonic
+
+import psutil
 from redis import Redis
-from umdalib.utils.computation import compute
+
 from umdalib.logger import logger
-import traceback
-import multiprocessing
+from umdalib.utils.computation import compute, get_module
+from umdalib.utils.job_context import (
+    JobCancelled,
+    cancel_key,
+    cooperative_key,
+    set_current_job,
+)
+from umdalib.utils.result_store import store_result
 
 redis_conn = Redis.from_url("redis://localhost:6379/0")
 
+# Modules imported by every pool child before it picks up its first job
+PRELOAD_PYFILES = [
+    "load_file.read_data",
+    "molecule_analysis.generate_analysis",
+    "ml_training.ml_prediction",
+    "vectorize_molecules.embedder",
+    "ml_training.ml_model",
+]
+
+# The pool is only safe when jobs run inside the long-lived worker process
+# (rq.SimpleWorker); start_redis_worker enables it via configure_worker_pool.
+worker_pool_enabled = False
+worker_pool_options = {
+    "size": 1,
+    "preload": PRELOAD_PYFILES,
+    "max_jobs_per_child": 20,
+    "max_memory_mb": 4096,
+}
+CANCEL_GRACE_PERIOD = 5  # seconds
+# how long a job that polls job_context.is_cancelled gets to stop on its own
+COOPERATIVE_CANCEL_TIMEOUT = 120  # seconds
+# how often an idle pool child checks that the worker that spawned it is alive
+PARENT_POLL_INTERVAL = 5  # seconds
+
 
 def publish_event(event_type, payload):
     """Publish event to Redis channel"""
@@ -17,64 +56,337 @@ def publish_event(event_type, payload):
         logger.error(f"Error publishing event: {str(e)}")
 
 
-def run_computation_in_process(result_queue, pyfile, args):
+def run_job(job_id: str, pyfile: str, args: dict | str, use_cache: bool = True):
+    """
+    Compute in the job process and move a large result to the result store, so
+    only a handle is pickled back to the worker, kept by RQ and published.
+    """
+    return store_result(compute(pyfile, args, use_cache=use_cache), job_id)
+
+
+def run_computation_in_process(result_queue, job_id, pyfile, args, use_cache=True):
     """Run the computation in a separate process"""
+    set_current_job(job_id)
     try:
-        result = compute(pyfile, args)
+        result = run_job(job_id, pyfile, args, use_cache)
         result_queue.put(result)
     except Exception as e:
         result_queue.put(e)
 
 
-def long_computation(job_id: str, pyfile: str, args: dict | str):
+def parent_is_gone(parent_pid: int) -> bool:
+    parent = multiprocessing.parent_process()
+    if parent is not None and not parent.is_alive():
+        return True
+    return os.getppid() != parent_pid  # re-parented to init
+
+
+def run_pool_child(
+    task_queue: multiprocessing.Queue,
+    result_queue: multiprocessing.Queue,
+    preload: list[str],
+):
+    """Import the heavy modules once, then run jobs from task_queue until told to stop"""
+    for pyfile in preload:
+        try:
+            get_module(pyfile)
+        except Exception as e:
+            logger.warning(f"Could not preload umdalib.{pyfile}: {e}")
+
+    logger.info(f"Pool child ready with {len(preload)} preloaded modules")
+
+    parent_pid = os.getppid()
+    while True:
+        try:
+            task = task_queue.get(timeout=PARENT_POLL_INTERVAL)
+        except queue.Empty:
+            if parent_is_gone(parent_pid):
+                # killed worker (SIGKILL, OOM): no stop sentinel will ever come
+                logger.warning("Worker process is gone, pool child exiting")
+                result_queue.cancel_join_thread()
+                break
+            continue
+        if task is None:
+            break
+
+        job_id, pyfile, args, use_cache = task
+        logger.info(f"Pool child running {pyfile} for job {job_id}")
+        set_current_job(job_id)
+        try:
+            result_queue.put(("result", run_job(job_id, pyfile, args, use_cache)))
+        except JobCancelled as e:
+            result_queue.put(("cancelled", str(e)))
+        except Exception as e:
+            result_queue.put(("error", e))
+        finally:
+            set_current_job(None)
+
+
+class PoolChild:
+    def __init__(self, ctx: SpawnContext, preload: list[str]):
+        self.task_queue = ctx.Queue()
+        self.result_queue = ctx.Queue()
+        self.process = ctx.Process(
+            target=run_pool_child,
+            args=(self.task_queue, self.result_queue, preload),
+            name="umdapy-pool-child",
+        )
+        self.process.start()
+        self.jobs_done = 0
+
+    def memory_mb(self) -> float:
+        try:
+            return psutil.Process(self.process.pid).memory_info().rss / 1024**2
+        except psutil.Error:
+            return 0.0
+
+    def stop(self, timeout: float = 5):
+        """Ask an idle child to exit, killing it if it does not"""
+        if self.process.is_alive():
+            self.task_queue.put(None)
+            self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            self.kill()
+
+    def kill(self, grace_period: float = CANCEL_GRACE_PERIOD):
+        """Terminate a (possibly busy) child, then force kill after grace_period"""
+        if not self.process.is_alive():
+            return
+        self.process.terminate()
+        self.process.join(timeout=grace_period)
+        if self.process.is_alive():
+            logger.warning(
+                f"Pool child {self.process.pid} did not terminate gracefully, forcing kill"
+            )
+            self.process.kill()
+            self.process.join()
+
+
+class WarmProcessPool:
+    """
+    Pre-spawned "spawn" processes with the heavy umdalib modules already imported.
+    A child is recycled after max_jobs_per_child jobs or once its resident memory
+    exceeds max_memory_mb, and is replaced straight away so the pool stays warm.
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        preload: list[str] = PRELOAD_PYFILES,
+        max_jobs_per_child: int = 20,
+        max_memory_mb: float = 4096,
+    ):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.size = max(int(size), 1)
+        self.preload = list(preload)
+        self.max_jobs_per_child = int(max_jobs_per_child)
+        self.max_memory_mb = float(max_memory_mb)
+        self.idle: list[PoolChild] = []
+        self.busy: list[PoolChild] = []
+        self.fill()
+
+    def fill(self):
+        self.idle = [child for child in self.idle if child.process.is_alive()]
+        while len(self.idle) + len(self.busy) < self.size:
+            self.idle.append(PoolChild(self.ctx, self.preload))
+            logger.info(f"Spawned pool child {self.idle[-1].process.pid}")
+
+    def acquire(self) -> PoolChild:
+        self.fill()
+        if not self.idle:
+            # more concurrent jobs than pool slots: hand out an extra (cold) child
+            self.idle.append(PoolChild(self.ctx, self.preload))
+        child = self.idle.pop(0)
+        self.busy.append(child)
+        return child
+
+    def release(self, child: PoolChild):
+        self.busy.remove(child)
+        child.jobs_done += 1
+
+        memory_mb = child.memory_mb()
+        if child.jobs_done >= self.max_jobs_per_child:
+            logger.info(
+                f"Recycling pool child {child.process.pid} after {child.jobs_done} jobs"
+            )
+            child.stop()
+        elif memory_mb > self.max_memory_mb:
+            logger.info(
+                f"Recycling pool child {child.process.pid} using {memory_mb:.0f} MB"
+            )
+            child.stop()
+        elif len(self.idle) + len(self.busy) >= self.size:
+            child.stop()
+        else:
+            self.idle.append(child)
+
+        self.fill()
+
+    def discard(self, child: PoolChild, grace_period: float = CANCEL_GRACE_PERIOD):
+        """Kill a busy child (cancelled, crashed or timed out) and replace it"""
+        if child in self.busy:
+            self.busy.remove(child)
+        child.kill(grace_period)
+        self.fill()
+
+    def shutdown(self):
+        for child in self.idle + self.busy:
+            child.stop(timeout=1)
+        self.idle = []
+        self.busy = []
+
+
+worker_pool: WarmProcessPool = None
+
+
+def configure_worker_pool(enabled: bool = True, **options):
+    """Enable the pool for this worker process and spawn its children right away"""
+    global worker_pool_enabled
+
+    worker_pool_enabled = enabled
+    worker_pool_options.update(
+        {key: value for key, value in options.items() if value is not None}
+    )
+    if enabled:
+        get_worker_pool()
+
+
+def get_worker_pool() -> WarmProcessPool:
+    global worker_pool
+
+    if worker_pool is None:
+        logger.info(f"Starting warm process pool: {worker_pool_options}")
+        worker_pool = WarmProcessPool(**worker_pool_options)
+        atexit.register(worker_pool.shutdown)
+    return worker_pool
+
+
+def get_cancel_deadline(job_id: str) -> float | None:
+    """
+    None while the job is not cancelled. Otherwise the monotonic time by which
+    it must have stopped: jobs that poll for cancellation get
+    COOPERATIVE_CANCEL_TIMEOUT to reach a checkpoint, others are stopped at once.
+    """
+    if not redis_conn.get(cancel_key(job_id)):
+        return None
+    if redis_conn.get(cooperative_key(job_id)):
+        logger.info(
+            f"Waiting up to {COOPERATIVE_CANCEL_TIMEOUT} s for {job_id} to stop"
+        )
+        return monotonic() + COOPERATIVE_CANCEL_TIMEOUT
+    return monotonic()
+
+
+def run_in_pool(job_id: str, pyfile: str, args: dict | str, use_cache: bool = True):
+    """Dispatch the job to a warm pool child, watching for cancellation"""
+    pool = get_worker_pool()
+    child = pool.acquire()
+    finished = False
+    cancel_deadline = None
+
+    try:
+        child.task_queue.put((job_id, pyfile, args, use_cache))
+
+        while True:
+            if cancel_deadline is None:
+                cancel_deadline = get_cancel_deadline(job_id)
+            if cancel_deadline is not None and monotonic() >= cancel_deadline:
+                return None, True
+
+            try:
+                status, payload = child.result_queue.get(timeout=0.5)
+            except queue.Empty:
+                if not child.process.is_alive():
+                    raise RuntimeError(
+                        f"Worker process exited unexpectedly with code {child.process.exitcode}"
+                    )
+                continue
+
+            finished = True
+            if status == "cancelled":
+                logger.info(f"Job {job_id} stopped cooperatively: {payload}")
+                return None, True
+            if status == "error":
+                raise payload
+            return payload, False
+    finally:
+        if finished:
+            pool.release(child)
+        else:
+            pool.discard(child)
+
+
+def run_in_new_process(
+    job_id: str, pyfile: str, args: dict | str, use_cache: bool = True
+):
+    """Spawn a fresh process for this job only"""
+
+    ctx = multiprocessing.get_context("spawn")
+    result_queue = ctx.Queue()
+    process = ctx.Process(
+        target=run_computation_in_process,
+        args=(result_queue, job_id, pyfile, args, use_cache),
+    )
+    process.start()
+
+    # Monitor for cancellation
+    cancel_deadline = None
+    while process.is_alive():
+        if cancel_deadline is None:
+            cancel_deadline = get_cancel_deadline(job_id)
+        if cancel_deadline is not None and monotonic() >= cancel_deadline:
+            # More graceful termination
+            process.terminate()
+            process.join(timeout=CANCEL_GRACE_PERIOD)
+            if process.is_alive():
+                logger.warning(
+                    f"Process for job {job_id} did not terminate gracefully, forcing kill"
+                )
+                process.kill()  # Force kill if still running after grace period
+                process.join()
+            return None, True
+        process.join(timeout=0.5)  # Check every 0.5 seconds
+
+    if redis_conn.get(cancel_key(job_id)):
+        return None, True
+
+    result = result_queue.get()
+    if isinstance(result, JobCancelled):
+        return None, True
+    if isinstance(result, Exception):
+        raise result
+    return result, False
+
+
+def long_computation(
+    job_id: str, pyfile: str, args: dict | str, use_cache: bool = True
+):
     """Worker function that performs computation and publishes events"""
     try:
         # Publish job started event
         publish_event("job_started", {"job_id": job_id, "status": "started"})
 
-        # Create a process for the computation
-        ctx = multiprocessing.get_context("spawn")
-        result_queue = ctx.Queue()
-        process = ctx.Process(
-            target=run_computation_in_process, args=(result_queue, pyfile, args)
-        )
-        process.start()
-
-        # Monitor for cancellation
-        while process.is_alive():
-            if redis_conn.get(f"job_cancelled_{job_id}"):
-                # More graceful termination
-                process.terminate()
-                grace_period = 5  # seconds
-                process.join(timeout=grace_period)
-                if process.is_alive():
-                    logger.warning(
-                        f"Process for job {job_id} did not terminate gracefully, forcing kill"
-                    )
-                    process.kill()  # Force kill if still running after grace period
-                    process.join()
-
-                publish_event(
-                    "job_cancelled",
-                    {
-                        "job_id": job_id,
-                        "status": "cancelled",
-                        "message": "Job was forcefully cancelled",
-                    },
-                )
-                return None
-            process.join(timeout=0.5)  # Check every 0.5 seconds
-
-        # Get result if process completed normally
-        if not redis_conn.get(f"job_cancelled_{job_id}"):
-            result = result_queue.get()
-            if isinstance(result, Exception):
-                raise result
+        if worker_pool_enabled:
+            result, cancelled = run_in_pool(job_id, pyfile, args, use_cache)
+        else:
+            result, cancelled = run_in_new_process(job_id, pyfile, args, use_cache)
+
+        if cancelled:
             publish_event(
-                "job_result",
-                {"job_id": job_id, "result": result, "status": "completed"},
+                "job_cancelled",
+                {
+                    "job_id": job_id,
+                    "status": "cancelled",
+                    "message": "Job was cancelled",
+                },
             )
-            return result
+            return None
+
+        publish_event(
+            "job_result",
+            {"job_id": job_id, "result": result, "status": "completed"},
+        )
+        return result
 
     except Exception as e:
         error_msg = str(e)
@@ -95,4 +407,4 @@ def long_computation(job_id: str, pyfile: str, args: dict | str):
         raise
     finally:
         # Clean up
-        redis_conn.delete(f"job_cancelled_{job_id}")
+        redis_conn.delete(cancel_key(job_id), cooperative_key(job_id))
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("rdkit")
+pytest.importorskip("mol2vec")
+word2vec = pytest.importorskip("gensim.models.word2vec")
+
+from umdalib.vectorize_molecules import embedding_cache  # noqa: E402
+from umdalib.vectorize_molecules.embedding_cache import EmbeddingCache  # noqa: E402
+from umdalib.vectorize_molecules.mol2vec_batch import (  # noqa: E402
+    mol2vec_sentences,
+    mol2vec_vectors,
+)
+
+# Kekule and aromatic spellings of benzene and pyridine
+SMILES = ["C1=CC=CC=C1", "c1ccccc1", "C1=CC=NC=C1", "c1ccncc1", "CCO"]
+
+
+@pytest.fixture
+def mol2vec_model(tmp_path):
+    model = word2vec.Word2Vec(
+        mol2vec_sentences(SMILES), vector_size=8, min_count=1, seed=0, workers=1
+    )
+    model_file = tmp_path / "mol2vec.model"
+    model.save(str(model_file))
+    return model, model_file
+
+
+def test_mol2vec_cache_matches_uncached(tmp_path, monkeypatch, mol2vec_model):
+    monkeypatch.setattr(
+        embedding_cache, "EMBEDDING_CACHE_FILE", tmp_path / "cache.sqlite"
+    )
+    model, model_file = mol2vec_model
+    cache = EmbeddingCache("mol2vec", model_file)
+
+    # whichever spelling is embedded first, the other one gets its own vector
+    for order in (SMILES, SMILES[::-1]):
+        vectors = cache.embed(pd.Series(order), lambda s: mol2vec_vectors(s, model))
+        np.testing.assert_array_equal(vectors, mol2vec_vectors(order, model))
+    cache.close()
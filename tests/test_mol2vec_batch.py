@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("rdkit")
+pytest.importorskip("mol2vec")
+word2vec = pytest.importorskip("gensim.models.word2vec")
+
+from mol2vec import features  # noqa: E402
+from rdkit import Chem  # noqa: E402
+
+from umdalib.vectorize_molecules import mol2vec_batch  # noqa: E402
+from umdalib.vectorize_molecules.chunked import EMBED_CHUNK_SIZE  # noqa: E402
+from umdalib.vectorize_molecules.mol2vec_batch import (  # noqa: E402
+    PARALLEL_MIN_SMILES,
+    mol2vec_sentences,
+    mol2vec_vectors,
+)
+
+SMILES = [
+    "CCO",
+    "c1ccccc1",
+    "C1=CC=CC=C1",
+    "CC(=O)Oc1ccccc1C(=O)O",
+    "CN1C=NC2=C1C(=O)N(C(=O)N2C)C",
+    "[NH4+]",
+    "not a smiles",
+    "nan",
+    "C#N",
+]
+
+
+def per_molecule_mol2vec(smi: str, model, radius: int = 1) -> np.ndarray:
+    """The former one-molecule-at-a-time mol2vec of vectorizer.mol2vec"""
+    smi = str(smi).replace("\xa0", "")
+    if smi == "nan":
+        return np.zeros(model.vector_size)
+    try:
+        mol = Chem.MolFromSmiles(smi, sanitize=False)
+        mol.UpdatePropertyCache(strict=False)
+        Chem.GetSymmSSSR(mol)
+        sentence = features.mol2alt_sentence(mol, radius)
+    except Exception:
+        return np.zeros(model.vector_size)
+    vector = np.zeros(model.vector_size)
+    for word in sentence:
+        if word in model.wv.key_to_index:
+            vector += model.wv[word]
+    return vector
+
+
+@pytest.fixture
+def model():
+    # "CCO" and benzene only, so the other molecules have unknown words
+    sentences = mol2vec_sentences(SMILES[:3])
+    return word2vec.Word2Vec(sentences, vector_size=16, min_count=1, seed=0, workers=1)
+
+
+def test_mol2vec_vectors_match_per_molecule_loop(model):
+    expected = np.array([per_molecule_mol2vec(smi, model) for smi in SMILES])
+    vectors = mol2vec_vectors(SMILES, model)
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(vectors, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_mol2vec_vectors_blocks_and_workers(model, monkeypatch):
+    smiles = SMILES * 40
+    expected = mol2vec_vectors(smiles, model)
+    monkeypatch.setattr(mol2vec_batch, "GATHER_BLOCK_SIZE", 7)
+    monkeypatch.setattr(mol2vec_batch, "SENTENCE_CHUNK_SIZE", 50)
+    monkeypatch.setattr(mol2vec_batch, "PARALLEL_MIN_SMILES", 100)
+    np.testing.assert_allclose(
+        mol2vec_vectors(smiles, model, n_jobs=2), expected, rtol=1e-5, atol=1e-6
+    )
+
+
+def test_chunks_are_large_enough_for_workers():
+    # embed_in_chunks hands mol2vec at most EMBED_CHUNK_SIZE SMILES at a time
+    assert PARALLEL_MIN_SMILES < EMBED_CHUNK_SIZE
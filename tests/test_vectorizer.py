@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+pytest.importorskip("gensim")
+
+from umdalib.vectorize_molecules.vectorizer import (  # noqa: E402
+    molecules_to_vectors_using_huggingface,
+    token_budget_batches,
+)
+
+SMILES = [
+    "CCO",
+    "c1ccccc1",
+    "CC(=O)Oc1ccccc1C(=O)O",
+    "C",
+    "CN1C=NC2=C1C(=O)N(C(=O)N2C)C",
+    "O=C=O",
+    "CCCCCCCCCCCCCCCC",
+    "C#N",
+    "N#CC(=O)[O-]",
+    "C1CCC2(CC1)CCCC2",
+]
+
+
+@pytest.fixture(scope="module")
+def bert(tmp_path_factory):
+    chars = sorted(set("".join(SMILES)))
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    vocab += chars + [f"##{char}" for char in chars]
+    vocab_file = tmp_path_factory.mktemp("bert") / "vocab.txt"
+    vocab_file.write_text("\n".join(vocab))
+    tokenizer = transformers.BertTokenizerFast(str(vocab_file), do_lower_case=False)
+
+    torch.manual_seed(0)
+    config = transformers.BertConfig(
+        vocab_size=len(vocab),
+        hidden_size=16,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=32,
+    )
+    return transformers.BertModel(config).eval(), tokenizer
+
+
+def fixed_size_batches_cls(model, tokenizer, smiles, batch_size):
+    """The former embedding loop: fixed-size batches in input order, CLS"""
+    embeddings = []
+    for i in range(0, len(smiles), batch_size):
+        inputs = tokenizer(
+            smiles[i : i + batch_size],
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+        )
+        with torch.no_grad():
+            outputs = model(**inputs)
+        embeddings.append(outputs.last_hidden_state[:, 0, :].numpy())
+    return np.vstack(embeddings).squeeze()
+
+
+@pytest.mark.parametrize("token_budget, max_batch_size", [(40, 3), (10**6, 256)])
+def test_length_bucketed_batches_match_fixed_batches(
+    bert, token_budget, max_batch_size
+):
+    model, tokenizer = bert
+    expected = fixed_size_batches_cls(model, tokenizer, SMILES, batch_size=4)
+    vectors = molecules_to_vectors_using_huggingface(
+        model,
+        tokenizer,
+        SMILES,
+        token_budget=token_budget,
+        max_batch_size=max_batch_size,
+        pooling=["cls"],
+    )
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(vectors, expected, rtol=1e-4, atol=1e-5)
+
+
+def test_empty_input(bert):
+    model, tokenizer = bert
+    vectors = molecules_to_vectors_using_huggingface(model, tokenizer, [])
+    assert vectors.shape == (0, model.config.hidden_size)
+
+
+def test_token_budget_batches():
+    lengths = np.array([5, 3, 9, 3, 7, 1, 9, 2])
+    batches = token_budget_batches(lengths, token_budget=18, max_batch_size=3)
+
+    order = np.concatenate(batches)
+    assert sorted(order) == list(range(len(lengths)))  # every input exactly once
+    for batch in batches:
+        assert len(batch) <= 3
+        assert len(batch) == 1 or len(batch) * lengths[batch].max() <= 18
+    assert token_budget_batches(np.array([], dtype=int), 18, 3) == []